@@ -0,0 +1,278 @@
+import os
+import sys
+import threading
+from collections import deque
+from PyQt6.QtCore import QThread, pyqtSignal
+import cv2
+from video_frame import fit_size
+
+
+# Resolución y FPS pedidos a la cámara (el driver usa lo más cercano que soporte).
+# El scanner detecta a 640 px, así que capturar más grande solo gasta ancho de banda
+CAMERA_WIDTH = 640
+CAMERA_HEIGHT = 480
+CAMERA_FPS = 30
+
+# Buffers de frame reciclados entre captura e inferencia (profundidad del pipeline)
+FRAME_POOL_SIZE = 3
+
+# Núcleo reservado para el hilo de captura; la inferencia usa el resto (Linux)
+CAPTURE_CPU = 0
+
+
+def fit_to_display(frame, display_size):
+    """
+    Reduce un frame al tamaño con que se mostrará, manteniendo aspect ratio
+    
+    cv2.resize (INTER_AREA) en el hilo de trabajo reemplaza el escalado de Qt
+    en el hilo de la GUI. Los frames más pequeños que el área se devuelven tal
+    cual (Qt los amplía al pintar).
+    
+    Args:
+        frame: Frame BGR
+        display_size: (ancho, alto) del área de dibujo, o None
+        
+    Returns:
+        Frame listo para mostrar (nuevo array o el mismo frame)
+    """
+    if display_size is None:
+        return frame
+    h, w = frame.shape[:2]
+    box_w, box_h = display_size
+    if box_w <= 0 or box_h <= 0:
+        return frame
+    dst_w, dst_h = fit_size(w, h, box_w, box_h)
+    if dst_w >= w or dst_h >= h:
+        return frame
+    # Array nuevo por frame: la GUI conserva el anterior mientras lo pinta
+    return cv2.resize(frame, (dst_w, dst_h), interpolation=cv2.INTER_AREA)
+
+
+def _pin_current_thread(cpus):
+    """
+    Fija el hilo que llama a un conjunto de núcleos (solo Linux)
+    
+    En Linux sched_setaffinity(0, ...) actúa sobre el hilo actual, no sobre
+    todo el proceso; solo los hilos que ese hilo cree después heredan la
+    afinidad, no los que ya existían. En otras plataformas, o con un solo
+    núcleo, no hace nada.
+    
+    Args:
+        cpus: Conjunto de índices de núcleo
+    """
+    if not hasattr(os, 'sched_setaffinity') or (os.cpu_count() or 1) < 2:
+        return
+    try:
+        os.sched_setaffinity(0, cpus)
+    except OSError:
+        # Núcleos fuera del cpuset permitido (contenedores, taskset)
+        pass
+
+
+def pin_inference_thread():
+    """
+    Fija el hilo actual a los núcleos de inferencia (todos menos CAPTURE_CPU)
+    
+    El pool interno de torch se crea en el primer forward, que ocurre en el
+    warmup de ScannerLoadThread: ese hilo debe fijarse antes de importar torch
+    para que el pool herede la afinidad. InferenceThread también se fija.
+    """
+    _pin_current_thread(set(range(os.cpu_count() or 1)) - {CAPTURE_CPU})
+
+
+def _gstreamer_available():
+    """Indica si OpenCV se compiló con soporte de GStreamer"""
+    for line in cv2.getBuildInformation().splitlines():
+        if line.strip().startswith('GStreamer:'):
+            return 'YES' in line
+    return False
+
+
+def _gstreamer_pipeline(index):
+    """
+    Pipeline v4l2 -> MJPG -> BGR que entrega solo el frame más reciente
+    
+    En Jetson decodifica el JPEG con nvjpegdec (hardware) en lugar de jpegdec.
+    """
+    decoder = 'nvjpegdec' if os.path.exists('/etc/nv_tegra_release') else 'jpegdec'
+    return (
+        f"v4l2src device=/dev/video{index} ! "
+        f"image/jpeg,width={CAMERA_WIDTH},height={CAMERA_HEIGHT},framerate={CAMERA_FPS}/1 ! "
+        f"{decoder} ! videoconvert ! video/x-raw,format=BGR ! "
+        "appsink drop=1 max-buffers=1"
+    )
+
+
+def open_camera(index=0):
+    """
+    Abre la webcam con el backend nativo de la plataforma y MJPG
+    
+    En Linux se intenta primero un pipeline de GStreamer (si OpenCV lo
+    soporta); si no abre, DirectShow en Windows evita el arranque lento de MSMF
+    y V4L2 en Linux lee la cámara directamente. Con MJPG la cámara envía frames
+    comprimidos en lugar de YUY2 sin comprimir, lo que reduce el ancho de banda
+    USB y la latencia.
+    
+    Args:
+        index: Índice de la cámara
+        
+    Returns:
+        cv2.VideoCapture (comprobar isOpened())
+    """
+    # En Linux, GStreamer decodifica el MJPG (por hardware en Jetson) y ya
+    # descarta los frames viejos en el appsink; el formato va en el pipeline
+    if sys.platform.startswith('linux') and _gstreamer_available():
+        capture = cv2.VideoCapture(_gstreamer_pipeline(index), cv2.CAP_GSTREAMER)
+        if capture.isOpened():
+            return capture
+        capture.release()
+    
+    if sys.platform == 'win32':
+        backend = cv2.CAP_DSHOW
+    elif sys.platform.startswith('linux'):
+        backend = cv2.CAP_V4L2
+    else:
+        backend = cv2.CAP_ANY
+    
+    capture = cv2.VideoCapture(index, backend)
+    if not capture.isOpened() and backend != cv2.CAP_ANY:
+        # Backend no disponible en este build de OpenCV
+        capture = cv2.VideoCapture(index)
+    if not capture.isOpened():
+        return capture
+    
+    # El FOURCC debe fijarse antes que la resolución para que el driver lo respete
+    capture.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+    capture.set(cv2.CAP_PROP_FRAME_WIDTH, CAMERA_WIDTH)
+    capture.set(cv2.CAP_PROP_FRAME_HEIGHT, CAMERA_HEIGHT)
+    capture.set(cv2.CAP_PROP_FPS, CAMERA_FPS)
+    capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    return capture
+
+
+class CaptureThread(QThread):
+    """
+    Lee frames de la cámara fuera del hilo de la GUI
+
+    Cada frame se entrega al consumidor con submit(); si el consumidor va más
+    lento que la cámara, los frames viejos se descartan en lugar de acumularse.
+    """
+
+    def __init__(self, capture, consumer):
+        """
+        Args:
+            capture: cv2.VideoCapture ya abierto (el hilo lo libera al terminar)
+            consumer: Objeto con método submit(frame), p. ej. InferenceThread.
+                Si además tiene take_buffer(), los frames se decodifican sobre
+                los buffers que devuelve en lugar de asignar uno nuevo cada vez
+        """
+        super().__init__()
+        self.capture = capture
+        self.consumer = consumer
+        self._take_buffer = getattr(consumer, 'take_buffer', None)
+
+        # Un solo frame en el buffer del driver: siempre se lee el más reciente
+        self.capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+    def run(self):
+        # La captura solo espera al driver y decodifica: un núcleo propio evita
+        # que rebote entre núcleos compitiendo con la inferencia
+        _pin_current_thread({CAPTURE_CPU})
+        
+        while not self.isInterruptionRequested():
+            # grab() solo captura; retrieve() decodifica el frame capturado
+            if not self.capture.grab():
+                self.msleep(5)
+                continue
+            # retrieve() escribe sobre el buffer reciclado si tiene el tamaño del
+            # frame; si no (o no hay ninguno libre) asigna uno nuevo
+            buffer = self._take_buffer() if self._take_buffer is not None else None
+            ret, frame = self.capture.retrieve(buffer)
+            if ret:
+                self.consumer.submit(frame)
+
+        self.capture.release()
+
+    def stop(self):
+        """Detiene la captura y espera a que el hilo termine"""
+        self.requestInterruption()
+        self.wait()
+
+
+class InferenceThread(QThread):
+    """
+    Ejecuta el scanner sobre el último frame recibido
+
+    Emite processed(frame_procesado) por cada frame; las personas detectadas
+    se consultan al scanner de forma incremental desde la GUI.
+    """
+
+    processed = pyqtSignal(object)
+
+    def __init__(self, scanner, display=None):
+        """
+        Args:
+            scanner: Instancia de LiveFaceScanner
+            display: Widget con atributo display_size (ancho, alto) al que se
+                reducen los frames antes de emitirlos (opcional)
+        """
+        super().__init__()
+        self.scanner = scanner
+        self.display = display
+        self._frames = deque(maxlen=1)  # Solo el frame más reciente
+        self._frame_available = threading.Event()
+        # Frames que ya nadie usa, para que la captura decodifique sobre ellos
+        self._free_buffers = deque(maxlen=FRAME_POOL_SIZE)
+
+    def submit(self, frame):
+        """Entrega un frame nuevo (descarta el anterior si aún no se procesó)"""
+        try:
+            dropped = self._frames.popleft()
+        except IndexError:
+            dropped = None
+        self._frames.append(frame)
+        self._frame_available.set()
+        if dropped is not None:
+            # Nunca llegó a la inferencia: se puede reutilizar ya
+            self._free_buffers.append(dropped)
+
+    def take_buffer(self):
+        """Buffer libre para el próximo frame, o None si no hay ninguno"""
+        try:
+            return self._free_buffers.pop()
+        except IndexError:
+            return None
+
+    def run(self):
+        # Captura, inferencia (torch) y GUI ya corren en paralelo: el pool interno
+        # de OpenCV (global al proceso) solo competiría por los mismos núcleos
+        cv2.setNumThreads(1)
+        # Inferencia en los núcleos restantes (el pool de torch se fijó en la carga)
+        pin_inference_thread()
+        
+        while True:
+            # Bloquea hasta que llegue un frame (o se pida detener): sin sondeo
+            self._frame_available.wait()
+            if self.isInterruptionRequested():
+                break
+            self._frame_available.clear()
+            try:
+                frame = self._frames.popleft()
+            except IndexError:
+                continue
+
+            processed_frame = self.scanner.process_frame(frame)
+            if self.display is not None:
+                processed_frame = fit_to_display(processed_frame, self.display.display_size)
+            self.processed.emit(processed_frame)
+            
+            # Si se emitió un array reducido, el frame de la cámara queda libre;
+            # si se emitió el mismo frame, la GUI lo retiene y no se recicla
+            if processed_frame is not frame:
+                self._free_buffers.append(frame)
+
+    def stop(self):
+        """Detiene el procesamiento y espera a que el hilo termine"""
+        self.requestInterruption()
+        self._frame_available.set()  # Despertar al hilo si está esperando
+        self.wait()
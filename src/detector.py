@@ -1,13 +1,58 @@
 import sys
 import os
+import threading
 import cv2
 import numpy as np
+import torch
+from concurrent.futures import ThreadPoolExecutor
 from ultralytics import YOLO
+from ultralytics.engine.results import Boxes
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+# Tablas de búsqueda para el rango de piel en YCrCb (133<=Cr<=173, 77<=Cb<=127)
+CR_SKIN_LUT = np.zeros(256, dtype=bool)
+CR_SKIN_LUT[133:174] = True
+CB_SKIN_LUT = np.zeros(256, dtype=bool)
+CB_SKIN_LUT[77:128] = True
+
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def skin_fraction(bgr):
+        """
+        Fracción de píxeles con tono de piel en una imagen BGR
+        
+        Convierte cada píxel a Cr/Cb en línea (misma fórmula que OpenCV) y
+        aplica el rango 133<=Cr<=173, 77<=Cb<=127 sin crear buffers intermedios.
+        """
+        h, w = bgr.shape[0], bgr.shape[1]
+        count = 0
+        for i in prange(h):
+            row_count = 0
+            for j in range(w):
+                b = bgr[i, j, 0]
+                g = bgr[i, j, 1]
+                r = bgr[i, j, 2]
+                y = 0.299 * r + 0.587 * g + 0.114 * b
+                cr = (r - y) * 0.713 + 128.0
+                cb = (b - y) * 0.564 + 128.0
+                if 132.5 <= cr < 173.5 and 76.5 <= cb < 127.5:
+                    row_count += 1
+            count += row_count
+        return count / (h * w)
 
 
 class ImprovedDetector:
 
-    def __init__(self, path_weights, min_confidence=0.6, min_face_size=40, max_aspect_ratio=2.5):
+    def __init__(self, path_weights, min_confidence=0.6, min_face_size=40, max_aspect_ratio=2.5,
+                 use_tensorrt=False, precision="fp16", imgsz=640, max_batch=1, int8_data=None,
+                 fused_nms=False, nms_iou=0.5, half=None):
         """
         Inicializa el detector mejorado
         
@@ -16,6 +61,14 @@ class ImprovedDetector:
             min_confidence: Confianza mínima para aceptar detección (default: 0.6)
             min_face_size: Tamaño mínimo en píxeles para la cara (default: 40)
             max_aspect_ratio: Ratio máximo ancho/alto permitido (default: 2.5)
+            use_tensorrt: Exportar/usar un engine TensorRT junto a los pesos (default: False)
+            precision: Precisión del engine: "fp32", "fp16" o "int8" (default: "fp16")
+            imgsz: Tamaño de entrada del modelo (default: 640)
+            max_batch: Tamaño máximo de batch del engine (default: 1)
+            int8_data: YAML del dataset de calibración para precision="int8"
+            fused_nms: Incluir el NMS (y el umbral min_confidence) dentro del engine (default: False)
+            nms_iou: Umbral de IoU del NMS embebido en el engine (default: 0.5)
+            half: Inferencia en FP16; None la activa automáticamente si hay CUDA (default: None)
         """
         if not os.path.exists(path_weights):
             print("\n" + "="*70)
@@ -24,6 +77,20 @@ class ImprovedDetector:
             print(f"\nRuta buscada: {path_weights}")
             sys.exit(1)
         
+        self.min_confidence = min_confidence
+        self.min_face_size = min_face_size
+        self.max_aspect_ratio = max_aspect_ratio
+        
+        self.imgsz = imgsz
+        self.max_batch = max_batch
+        self.fused_nms = False
+        
+        if use_tensorrt and not path_weights.endswith('.engine'):
+            path_weights = self._export_engine(path_weights, precision, int8_data, fused_nms, nms_iou)
+        
+        # Los engines TensorRT tienen un batch máximo fijo al exportar
+        self.is_engine = path_weights.endswith('.engine')
+        
         try:
             self.model = YOLO(path_weights)
             print(f"Modelo YOLO cargado: {path_weights}")
@@ -31,9 +98,24 @@ class ImprovedDetector:
             print(f"\n Error al cargar el modelo YOLO: {e}")
             sys.exit(1)
         
-        self.min_confidence = min_confidence
-        self.min_face_size = min_face_size
-        self.max_aspect_ratio = max_aspect_ratio
+        # FP16 solo tiene efecto (y sentido) en GPU
+        self.half = torch.cuda.is_available() if half is None else half
+        
+        # Las entradas tienen tamaño casi fijo: dejar que cuDNN elija los kernels más rápidos
+        if torch.cuda.is_available():
+            torch.backends.cudnn.benchmark = True
+        
+        # Compilar el kernel de piel ahora para no pagar el JIT en el primer frame.
+        # Numba compila una firma por layout: _has_skin_tone recibe recortes del
+        # frame (layout 'A'), así que se calienta con una vista no contigua
+        if NUMBA_AVAILABLE:
+            skin_fraction(np.zeros((9, 9, 3), dtype=np.uint8)[:8, :8])
+        
+        # Pool para solapar inferencia y filtrado (se crea bajo demanda)
+        self._pipeline_pool = None
+        
+        # Buffers reutilizables del filtro de piel, uno por hilo (detect_stream filtra en otro hilo)
+        self._scratch = threading.local()
         
         # Estadísticas de filtrado
         self.stats = {
@@ -45,7 +127,60 @@ class ImprovedDetector:
             'valid_detections': 0
         }
 
-    def detect_objects(self, img, conf, iou):
+    def _export_engine(self, path_weights, precision, int8_data, fused_nms, nms_iou):
+        """
+        Exporta el modelo a un engine TensorRT y lo guarda junto a los pesos
+        
+        Si el engine ya existe se reutiliza. Si la exportación falla
+        (sin GPU o sin TensorRT) se sigue usando el modelo .pt original.
+        Con fused_nms el engine incluye el NMS y el umbral de confianza, de
+        modo que solo devuelve las detecciones finales.
+        
+        Returns:
+            Ruta al modelo a cargar
+        """
+        suffix = '-nms.engine' if fused_nms else '.engine'
+        engine_path = os.path.splitext(path_weights)[0] + suffix
+        if os.path.exists(engine_path):
+            self.fused_nms = fused_nms
+            return engine_path
+        
+        export_args = dict(
+            format="engine",
+            imgsz=self.imgsz,
+            half=(precision == "fp16"),
+            int8=(precision == "int8"),
+            data=int8_data,
+            dynamic=True,
+            batch=self.max_batch,
+            verbose=False
+        )
+        if fused_nms:
+            export_args.update(nms=True, conf=self.min_confidence, iou=nms_iou)
+        
+        try:
+            print(f"Exportando modelo a TensorRT ({precision})...")
+            exported = YOLO(path_weights).export(**export_args)
+            if exported != engine_path:
+                os.replace(exported, engine_path)
+            print(f"Engine TensorRT creado: {engine_path}")
+            self.fused_nms = fused_nms
+            return engine_path
+        except Exception as e:
+            if fused_nms:
+                # Versiones antiguas de ultralytics no soportan nms=True en la exportación
+                print(f"No se pudo exportar con NMS embebido, reintentando sin él: {e}")
+                return self._export_engine(path_weights, precision, int8_data, False, nms_iou)
+            print(f"No se pudo exportar a TensorRT, usando {path_weights}: {e}")
+            return path_weights
+
+    def _predict(self, source, conf, iou, imgsz=None):
+        """Ejecuta el modelo sin registro de autograd"""
+        kwargs = {} if imgsz is None else {'imgsz': imgsz}
+        with torch.inference_mode():
+            return self.model(source, conf=conf, iou=iou, half=self.half, verbose=False, **kwargs)
+
+    def detect_objects(self, img, conf, iou, imgsz=None):
         """
         Detecta caras en una imagen con filtros de validación
         
@@ -53,18 +188,111 @@ class ImprovedDetector:
             img: Imagen a procesar
             conf: Umbral de confianza
             iou: Umbral de IoU para NMS
+            imgsz: Tamaño de entrada del modelo para esta llamada (None = self.imgsz)
             
         Returns:
             Resultados de la detección (solo caras válidas)
         """
-        # Detección básica con YOLO
-        results = self.model(img, conf=conf, iou=iou, verbose=False)
+        # Reducir en CPU las imágenes mucho más grandes que la entrada del modelo,
+        # YOLO las reduciría igual pero tras copiarlas completas a la GPU
+        h, w = img.shape[:2]
+        scale = (imgsz or self.imgsz) / max(h, w)
+        
+        if scale < 0.9:
+            img_small = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            result = self._predict(img_small, conf, iou, imgsz)[0]
+            result = self._rescale_result(result, img, img_small.shape[:2])
+        else:
+            # Detección básica con YOLO
+            result = self._predict(img, conf, iou, imgsz)[0]
         
         # Aplicar filtros adicionales
-        filtered_results = self._filter_detections(results[0], img)
+        filtered_results = self._filter_detections(result, img)
         
         return [filtered_results]
     
+    def _rescale_result(self, result, img, small_shape):
+        """Lleva las cajas de un resultado sobre la imagen reducida a la imagen original"""
+        h, w = img.shape[:2]
+        result.orig_img = img
+        result.orig_shape = (h, w)
+        
+        if result.boxes is None or len(result.boxes) == 0:
+            return result
+        
+        data = result.boxes.data.clone()
+        data[:, [0, 2]] *= w / small_shape[1]
+        data[:, [1, 3]] *= h / small_shape[0]
+        result.boxes = Boxes(data, (h, w))
+        return result
+    
+    def detect_objects_batch(self, imgs, conf, iou):
+        """
+        Detecta caras en varias imágenes con una sola pasada del modelo
+        
+        Args:
+            imgs: Lista de imágenes a procesar
+            conf: Umbral de confianza
+            iou: Umbral de IoU para NMS
+            
+        Returns:
+            Lista de resultados filtrados, uno por imagen
+        """
+        if len(imgs) == 0:
+            return []
+        
+        batch = self.max_batch if self.is_engine else len(imgs)
+        
+        filtered = []
+        for start in range(0, len(imgs), batch):
+            chunk = list(imgs[start:start + batch])
+            results = self._predict(chunk, conf, iou)
+            for result, img in zip(results, chunk):
+                filtered.append(self._filter_detections(result, img))
+        
+        return filtered
+    
+    def detect_stream(self, frames, conf, iou):
+        """
+        Detecta caras sobre una secuencia de frames solapando inferencia y filtrado
+        
+        Mientras el modelo procesa el frame t en un hilo de trabajo, el hilo
+        llamador filtra (tamaño, aspect ratio, piel) los resultados del frame t-1.
+        
+        Args:
+            frames: Iterable de imágenes a procesar
+            conf: Umbral de confianza
+            iou: Umbral de IoU para NMS
+            
+        Yields:
+            (frame, resultados_filtrados) en el mismo orden de entrada
+        """
+        if self._pipeline_pool is None:
+            self._pipeline_pool = ThreadPoolExecutor(max_workers=1)
+        
+        def infer(img):
+            return self._predict(img, conf, iou)[0]
+        
+        # Evitar que torch compita por los núcleos con el hilo de filtrado, solo
+        # mientras dure el stream: set_num_threads es global al proceso
+        prev_threads = torch.get_num_threads()
+        torch.set_num_threads(max(1, (os.cpu_count() or 2) // 2))
+        pending = None  # (frame, future) en vuelo
+        try:
+            for frame in frames:
+                future = self._pipeline_pool.submit(infer, frame)
+                if pending is not None:
+                    prev_frame, prev_future = pending
+                    yield prev_frame, self._filter_detections(prev_future.result(), prev_frame)
+                pending = (frame, future)
+            
+            if pending is not None:
+                prev_frame, prev_future = pending
+                yield prev_frame, self._filter_detections(prev_future.result(), prev_frame)
+        finally:
+            # También si el llamador cierra el generador antes de agotarlo
+            torch.set_num_threads(prev_threads)
+    
     def _filter_detections(self, results, img):
         """
         Filtra detecciones para reducir falsos positivos
@@ -79,48 +307,56 @@ class ImprovedDetector:
         if results.boxes is None or len(results.boxes) == 0:
             return results
         
-        valid_indices = []
+        boxes = results.boxes
+        total = len(boxes)
+        self.stats['total_detections'] += total
         
-        for i, box in enumerate(results.boxes):
-            self.stats['total_detections'] += 1
-            
-            # Obtener datos de la caja
-            confidence = float(box.conf[0])
-            x1, y1, x2, y2 = map(int, box.xyxy[0])
-            
-            # Filtro 1: Confianza mínima
-            if confidence < self.min_confidence:
-                self.stats['filtered_confidence'] += 1
-                continue
-            
-            # Filtro 2: Tamaño mínimo
-            width = x2 - x1
-            height = y2 - y1
-            
-            if width < self.min_face_size or height < self.min_face_size:
-                self.stats['filtered_size'] += 1
-                continue
-            
-            # Filtro 3: Aspect ratio razonable (las caras no son muy alargadas)
-            aspect_ratio = max(width / height, height / width)
-            if aspect_ratio > self.max_aspect_ratio:
-                self.stats['filtered_aspect'] += 1
-                continue
-            
-            # Filtro 4: Detección de tonos de piel (básico)
+        # Filtro 1: Confianza mínima, aplicado en el dispositivo antes de copiar a CPU
+        # (ya aplicado dentro del engine si tiene NMS embebido)
+        if not self.fused_nms:
+            boxes = boxes[boxes.conf >= self.min_confidence]
+            self.stats['filtered_confidence'] += total - len(boxes)
+        
+        if len(boxes) == 0:
+            results.boxes = None
+            return results
+        
+        # Copiar solo las cajas supervivientes a CPU, en una sola transferencia
+        xyxy = boxes.xyxy.cpu().numpy().astype(np.int64)
+        
+        width = xyxy[:, 2] - xyxy[:, 0]
+        height = xyxy[:, 3] - xyxy[:, 1]
+        
+        # Filtro 2: Tamaño mínimo
+        mask_size = (width >= self.min_face_size) & (height >= self.min_face_size)
+        
+        # Filtro 3: Aspect ratio razonable (las caras no son muy alargadas)
+        aspect_ratio = np.maximum(width, height) / np.maximum(np.minimum(width, height), 1)
+        mask_aspect = aspect_ratio <= self.max_aspect_ratio
+        
+        # Los contadores siguen la cascada: cada caja cuenta solo en el primer filtro que falla
+        self.stats['filtered_size'] += int(np.count_nonzero(~mask_size))
+        passed = mask_size
+        self.stats['filtered_aspect'] += int(np.count_nonzero(passed & ~mask_aspect))
+        passed = passed & mask_aspect
+        
+        # Filtro 4: Detección de tonos de piel (básico), solo sobre las supervivientes
+        valid_indices = []
+        for i in np.flatnonzero(passed):
+            x1, y1, x2, y2 = xyxy[i]
             face_region = img[y1:y2, x1:x2]
             if not self._has_skin_tone(face_region):
                 self.stats['filtered_skin'] += 1
                 continue
             
             # Si pasó todos los filtros, es válida
-            valid_indices.append(i)
+            valid_indices.append(int(i))
             self.stats['valid_detections'] += 1
         
         # Crear nuevo resultado solo con detecciones válidas
         if len(valid_indices) > 0:
             # Filtrar boxes
-            valid_boxes = results.boxes[valid_indices]
+            valid_boxes = boxes[valid_indices]
             results.boxes = valid_boxes
         else:
             # No hay detecciones válidas
@@ -142,21 +378,23 @@ class ImprovedDetector:
         if face_region.size == 0:
             return False
         
+        if NUMBA_AVAILABLE and face_region.ndim == 3 and face_region.shape[2] == 3:
+            return skin_fraction(face_region) * 100 >= min_skin_percentage
+        
         try:
-            # Convertir a YCrCb (mejor para detección de piel)
-            ycrcb = cv2.cvtColor(face_region, cv2.COLOR_BGR2YCrCb)
+            h, w = face_region.shape[:2]
+            ycrcb, skin_mask, cb_mask = self._skin_scratch(h, w)
             
-            # Rangos de tono de piel en YCrCb (funciona para diversos tonos)
-            lower_skin = np.array([0, 133, 77], dtype=np.uint8)
-            upper_skin = np.array([255, 173, 127], dtype=np.uint8)
+            # Convertir a YCrCb (mejor para detección de piel)
+            cv2.cvtColor(face_region, cv2.COLOR_BGR2YCrCb, dst=ycrcb)
             
-            # Crear máscara de piel
-            skin_mask = cv2.inRange(ycrcb, lower_skin, upper_skin)
+            # Rango de piel por canal mediante LUT (el canal Y no se evalúa)
+            np.take(CR_SKIN_LUT, ycrcb[:, :, 1], out=skin_mask)
+            np.take(CB_SKIN_LUT, ycrcb[:, :, 2], out=cb_mask)
+            np.logical_and(skin_mask, cb_mask, out=skin_mask)
             
             # Calcular porcentaje de piel
-            skin_pixels = np.count_nonzero(skin_mask)
-            total_pixels = face_region.shape[0] * face_region.shape[1]
-            skin_percentage = (skin_pixels / total_pixels) * 100
+            skin_percentage = np.count_nonzero(skin_mask) / (h * w) * 100
             
             return skin_percentage >= min_skin_percentage
             
@@ -164,6 +402,34 @@ class ImprovedDetector:
             # En caso de error, asumir que es válida
             return True
     
+    def _skin_scratch(self, h, w):
+        """
+        Vistas contiguas (h, w) sobre los buffers del hilo actual
+        
+        Los buffers solo crecen, así que tras los primeros frames no se reservan más.
+        
+        Returns:
+            (ycrcb (h, w, 3) uint8, mascara_cr (h, w) bool, mascara_cb (h, w) bool)
+        """
+        scratch = self._scratch
+        n = h * w
+        if getattr(scratch, 'capacity', 0) < n:
+            scratch.ycrcb = np.empty(n * 3, dtype=np.uint8)
+            scratch.cr_mask = np.empty(n, dtype=bool)
+            scratch.cb_mask = np.empty(n, dtype=bool)
+            scratch.capacity = n
+        return (
+            scratch.ycrcb[:n * 3].reshape(h, w, 3),
+            scratch.cr_mask[:n].reshape(h, w),
+            scratch.cb_mask[:n].reshape(h, w)
+        )
+    
+    def close(self):
+        """Libera el pool de hilos del pipeline"""
+        if self._pipeline_pool is not None:
+            self._pipeline_pool.shutdown(wait=True)
+            self._pipeline_pool = None
+    
     def get_stats(self):
         """Retorna estadísticas de filtrado"""
         return self.stats.copy()
@@ -8,11 +8,100 @@ from PyQt6.QtWidgets import (
     QScrollArea, QWidget, QFrame, QLineEdit, QMessageBox,
     QRadioButton, QButtonGroup
 )
-from PyQt6.QtGui import QPixmap, QImage
+from PyQt6.QtGui import QPixmap, QPixmapCache
 from PyQt6.QtCore import Qt
-import cv2
+import hashlib
 import numpy as np
 
+from face_widget import face_thumbnail
+
+
+# Lado de las miniaturas de la lista de caras
+THUMB_SIZE = 100
+
+
+# Hojas de estilo compartidas por todas las instancias
+_SCROLL_STYLESHEET = """
+    QScrollArea {
+        border: 1px solid #3a3f4b;
+        border-radius: 8px;
+        background-color: #1a1d23;
+    }
+"""
+
+_LINEEDIT_STYLESHEET = """
+    QLineEdit {
+        padding: 10px;
+        font-size: 11pt;
+        border: 2px solid #3a3f4b;
+        border-radius: 5px;
+        background-color: #1a1d23;
+        color: white;
+    }
+    QLineEdit:focus {
+        border-color: #5865f2;
+    }
+"""
+
+_DIALOG_STYLESHEET = """
+    QDialog {
+        background-color: #0f1116;
+    }
+
+    QPushButton {
+        background-color: #5865f2;
+        color: white;
+        border: none;
+        border-radius: 8px;
+        padding: 10px 20px;
+        font-size: 11pt;
+        font-weight: bold;
+    }
+
+    QPushButton:hover {
+        background-color: #4752c4;
+    }
+
+    QPushButton#cancelButton {
+        background-color: #ed4245;
+    }
+
+    QPushButton#cancelButton:hover {
+        background-color: #c03537;
+    }
+
+    QPushButton#registerButton {
+        background-color: #43b581;
+    }
+
+    QPushButton#registerButton:hover {
+        background-color: #3ca374;
+    }
+"""
+
+_FACE_ITEM_STYLESHEET = """
+    QFrame#faceItem {
+        background-color: #1a1d23;
+        border: 2px solid #3a3f4b;
+        border-radius: 8px;
+        padding: 10px;
+    }
+    QFrame#faceItem:hover {
+        border-color: #5865f2;
+    }
+"""
+
+_RADIO_STYLESHEET = """
+    QRadioButton {
+        color: white;
+        font-size: 11pt;
+    }
+    QRadioButton::indicator {
+        width: 20px;
+        height: 20px;
+    }
+"""
+
 
 class SelectFaceDialog(QDialog):
     """Diálogo para seleccionar qué cara desconocida registrar"""
@@ -49,13 +138,7 @@ class SelectFaceDialog(QDialog):
         scroll = QScrollArea()
         scroll.setWidgetResizable(True)
         scroll.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
-        scroll.setStyleSheet("""
-            QScrollArea {
-                border: 1px solid #3a3f4b;
-                border-radius: 8px;
-                background-color: #1a1d23;
-            }
-        """)
+        scroll.setStyleSheet(_SCROLL_STYLESHEET)
         
         scroll_content = QWidget()
         scroll_layout = QVBoxLayout(scroll_content)
@@ -83,19 +166,7 @@ class SelectFaceDialog(QDialog):
         
         self.name_input = QLineEdit()
         self.name_input.setPlaceholderText("Ingresa el nombre completo...")
-        self.name_input.setStyleSheet("""
-            QLineEdit {
-                padding: 10px;
-                font-size: 11pt;
-                border: 2px solid #3a3f4b;
-                border-radius: 5px;
-                background-color: #1a1d23;
-                color: white;
-            }
-            QLineEdit:focus {
-                border-color: #5865f2;
-            }
-        """)
+        self.name_input.setStyleSheet(_LINEEDIT_STYLESHEET)
         name_layout.addWidget(self.name_input)
         
         layout.addLayout(name_layout)
@@ -119,73 +190,20 @@ class SelectFaceDialog(QDialog):
         layout.addLayout(buttons_layout)
         
         # Estilos
-        self.setStyleSheet("""
-            QDialog {
-                background-color: #0f1116;
-            }
-            
-            QPushButton {
-                background-color: #5865f2;
-                color: white;
-                border: none;
-                border-radius: 8px;
-                padding: 10px 20px;
-                font-size: 11pt;
-                font-weight: bold;
-            }
-            
-            QPushButton:hover {
-                background-color: #4752c4;
-            }
-            
-            QPushButton#cancelButton {
-                background-color: #ed4245;
-            }
-            
-            QPushButton#cancelButton:hover {
-                background-color: #c03537;
-            }
-            
-            QPushButton#registerButton {
-                background-color: #43b581;
-            }
-            
-            QPushButton#registerButton:hover {
-                background-color: #3ca374;
-            }
-        """)
+        self.setStyleSheet(_DIALOG_STYLESHEET)
     
     def _create_face_item(self, index, person_data):
         """Crea un widget para mostrar una cara"""
         frame = QFrame()
         frame.setObjectName("faceItem")
-        frame.setStyleSheet("""
-            QFrame#faceItem {
-                background-color: #1a1d23;
-                border: 2px solid #3a3f4b;
-                border-radius: 8px;
-                padding: 10px;
-            }
-            QFrame#faceItem:hover {
-                border-color: #5865f2;
-            }
-        """)
+        frame.setStyleSheet(_FACE_ITEM_STYLESHEET)
         
         layout = QHBoxLayout(frame)
         layout.setSpacing(15)
         
         # Radio button para selección
         radio = QRadioButton()
-        radio.setStyleSheet("""
-            QRadioButton {
-                color: white;
-                font-size: 11pt;
-            }
-            QRadioButton::indicator {
-                width: 20px;
-                height: 20px;
-            }
-        """)
+        radio.setStyleSheet(_RADIO_STYLESHEET)
         self.button_group.addButton(radio, index)
         
         # Seleccionar el primero por defecto
@@ -198,11 +216,15 @@ class SelectFaceDialog(QDialog):
         face_img = person_data.get('face_image')
         
         img_label = QLabel()
-        img_label.setFixedSize(100, 100)
+        img_label.setFixedSize(THUMB_SIZE, THUMB_SIZE)
         img_label.setStyleSheet("border: 1px solid #3a3f4b; border-radius: 5px;")
         
         if face_img is not None:
-            pixmap = self._convert_face_to_pixmap(face_img)
+            # Reutilizar la miniatura si ya se generó en una apertura anterior
+            pixmap = person_data.get('thumb_pixmap')
+            if pixmap is None:
+                pixmap = self._cached_face_pixmap(face_img)
+                person_data['thumb_pixmap'] = pixmap
             img_label.setPixmap(pixmap)
         
         layout.addWidget(img_label)
@@ -231,17 +253,19 @@ class SelectFaceDialog(QDialog):
         
         return frame
     
-    def _convert_face_to_pixmap(self, face_img):
-        """Convierte imagen de cara a QPixmap"""
-        if isinstance(face_img, np.ndarray):
-            rgb_img = cv2.cvtColor(face_img, cv2.COLOR_BGR2RGB)
-            h, w, ch = rgb_img.shape
-            bytes_per_line = ch * w
-            q_img = QImage(rgb_img.data, w, h, bytes_per_line, QImage.Format.Format_RGB888)
-            pixmap = QPixmap.fromImage(q_img)
-            return pixmap.scaled(100, 100, Qt.AspectRatioMode.KeepAspectRatio, 
-                                Qt.TransformationMode.SmoothTransformation)
-        return QPixmap()
+    def _cached_face_pixmap(self, face_img):
+        """Miniatura de la cara usando QPixmapCache (compartida entre diálogos)"""
+        if not isinstance(face_img, np.ndarray):
+            return QPixmap()
+        
+        digest = hashlib.blake2b(np.ascontiguousarray(face_img).data, digest_size=8).hexdigest()
+        key = f"face_thumb_{face_img.shape[0]}x{face_img.shape[1]}_{digest}"
+        
+        pixmap = QPixmapCache.find(key)
+        if pixmap is None or pixmap.isNull():
+            pixmap = face_thumbnail(face_img, THUMB_SIZE)
+            QPixmapCache.insert(key, pixmap)
+        return pixmap
     
     def register_person(self):
         """Valida y registra la persona seleccionada"""
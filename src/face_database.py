@@ -1,11 +1,78 @@
 import sqlite3
 import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import shutil
 from pathlib import Path
-import imagehash
 from PIL import Image
 import cv2
 import numpy as np
+import scipy.fft
+
+# FAISS es opcional: si está disponible, la búsqueda Hamming usa su índice binario
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+
+from face_utils_numba import NUMBA_AVAILABLE
+if NUMBA_AVAILABLE:
+    from face_utils_numba import hamming_best_match_numba
+
+
+# Resultados de búsqueda recientes que se conservan en memoria
+MATCH_CACHE_SIZE = 4096
+
+# PRAGMAs aplicados al conectar. WAL + synchronous=NORMAL: un fsync por
+# checkpoint en lugar de uno por commit; mmap evita copias en las lecturas
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'temp_store': 'MEMORY',
+    'mmap_size': 268435456,
+    'cache_size': -65536,
+    'busy_timeout': 60000
+}
+
+# Tabla de conteo de bits por byte para Hamming vectorizado
+POPCOUNT_LUT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint16)
+
+
+def _hash_to_bytes(value):
+    """
+    Convierte un hash a bytes crudos (None si no es válido)
+    
+    Acepta bytes (columnas BLOB) o strings hexadecimales (hashes calculados
+    en memoria y filas de bases de datos antiguas).
+    """
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value)
+    try:
+        return bytes.fromhex(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _majority_hash(hex_hashes):
+    """
+    Combina varios hashes hexadecimales en uno por voto mayoritario bit a bit
+    
+    Los empates se resuelven con el primer hash de la lista.
+    
+    Args:
+        hex_hashes: Lista de hashes (misma longitud) como strings hexadecimales
+        
+    Returns:
+        Hash combinado como string hexadecimal
+    """
+    n = len(hex_hashes)
+    packed = np.frombuffer(b''.join(bytes.fromhex(h) for h in hex_hashes), dtype=np.uint8)
+    bits = np.unpackbits(packed.reshape(n, -1), axis=1)
+    votes = 2 * bits.sum(axis=0, dtype=np.int32) - n
+    combined = (votes > 0) | ((votes == 0) & (bits[0] == 1))
+    return np.packbits(combined).tobytes().hex()
 
 
 class FaceDatabase:
@@ -14,10 +81,43 @@ class FaceDatabase:
     Almacena personas registradas con sus hashes faciales
     """
     
-    def __init__(self, db_path, images_cache_dir="data/face_images"):
+    def __init__(self, db_path, images_cache_dir="data/face_images", pragmas=None):
+        """
+        Args:
+            db_path: Ruta a la base de datos SQLite
+            images_cache_dir: Carpeta donde se guardan las imágenes registradas
+            pragmas: PRAGMAs que reemplazan o amplían DEFAULT_PRAGMAS (opcional)
+        """
         self.db_path = db_path
         self.images_cache_dir = images_cache_dir
+        self.pragmas = {**DEFAULT_PRAGMAS, **(pragmas or {})}
         self.conn = None
+        # La conexión se comparte entre hilos (carga, inferencia, GUI): todo uso
+        # de self.conn pasa por este lock. Orden de adquisición: _conn_lock y
+        # luego _cache_lock, nunca al revés
+        self._conn_lock = threading.RLock()
+        
+        # Índice en memoria de hashes empaquetados, agrupado por longitud en bytes:
+        # {n_bytes: (nombres, rutas, matriz_normal (N, n_bytes), matriz_volteada (N, n_bytes), busqueda)}
+        # donde busqueda es el índice binario FAISS o, sin FAISS, las palabras para
+        # XOR en bloque (en ambos casos normales seguidos de volteados). Cada grupo
+        # es una tupla que no se modifica y el diccionario se reemplaza entero al
+        # escribir: una búsqueda usa siempre un grupo consistente
+        self._hash_index = {}
+        self._cache_valid = False
+        self._cache_lock = threading.Lock()
+        
+        # LRU {(hash_bytes, umbral): resultado}; la generación descarta resultados
+        # calculados con un índice que una escritura dejó obsoleto
+        self._match_cache = OrderedDict()
+        self._cache_generation = 0
+        
+        # Escritura de imágenes JPEG en segundo plano (pool creado bajo demanda).
+        # _writes_lock protege _io_pool y _pending_writes; se toma siempre sin
+        # pedir ningún otro lock mientras se tiene
+        self._io_pool = None
+        self._pending_writes = []
+        self._writes_lock = threading.Lock()
         
         # Crear directorios si no existen
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
@@ -25,9 +125,25 @@ class FaceDatabase:
     
     def connect(self):
         """Conecta a la base de datos y crea las tablas si no existen"""
-        self.conn = sqlite3.connect(self.db_path)
-        self._create_tables()
-        return self.conn
+        with self._conn_lock:
+            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            
+            for name, value in self.pragmas.items():
+                self.conn.execute(f'PRAGMA {name}={value}')
+            
+            self._create_tables()
+            self._analyze_once()
+            self._cache_valid = False
+            return self.conn
+    
+    def _analyze_once(self):
+        """Genera estadísticas para el planificador si la BD aún no tiene"""
+        has_stats = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'"
+        ).fetchone()
+        if not has_stats:
+            self.conn.execute('ANALYZE')
+            self.conn.commit()
     
     def _create_tables(self):
         """Crea las tablas necesarias"""
@@ -38,27 +154,162 @@ class FaceDatabase:
             CREATE TABLE IF NOT EXISTS persons (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 name TEXT NOT NULL UNIQUE,
-                hash_normal TEXT NOT NULL,
-                hash_flipped TEXT NOT NULL,
+                hash_normal BLOB NOT NULL,
+                hash_flipped BLOB NOT NULL,
                 image_path TEXT,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
         
-        # Índices para búsqueda rápida
-        cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_hash_normal 
-            ON persons(hash_normal)
-        ''')
+        self._migrate_text_hashes()
+        
+        # Las búsquedas por nombre usan el índice implícito de UNIQUE(name) y las
+        # de id el rowid. Los hashes se comparan en memoria, nunca en un WHERE,
+        # así que sus índices solo encarecían cada INSERT/UPDATE: se eliminan
+        cursor.execute('DROP INDEX IF EXISTS idx_hash_normal')
+        cursor.execute('DROP INDEX IF EXISTS idx_hash_flipped')
+        
+        self.conn.commit()
+    
+    def _migrate_text_hashes(self):
+        """Convierte bases de datos antiguas con hashes hex (TEXT) a BLOB"""
+        cursor = self.conn.cursor()
+        cursor.execute('PRAGMA table_info(persons)')
+        column_types = {row[1]: row[2].upper() for row in cursor.fetchall()}
+        if column_types.get('hash_normal') != 'TEXT':
+            return
         
         cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_hash_flipped 
-            ON persons(hash_flipped)
+            CREATE TABLE persons_new (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL UNIQUE,
+                hash_normal BLOB NOT NULL,
+                hash_flipped BLOB NOT NULL,
+                image_path TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
         ''')
         
+        cursor.execute('SELECT id, name, hash_normal, hash_flipped, image_path, created_at FROM persons')
+        rows = []
+        for person_id, name, hash_normal, hash_flipped, image_path, created_at in cursor.fetchall():
+            normal = _hash_to_bytes(hash_normal)
+            flipped = _hash_to_bytes(hash_flipped)
+            if normal is None or flipped is None:
+                continue
+            rows.append((person_id, name, normal, flipped, image_path, created_at))
+        
+        cursor.executemany('''
+            INSERT INTO persons_new (id, name, hash_normal, hash_flipped, image_path, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', rows)
+        cursor.execute('DROP TABLE persons')
+        cursor.execute('ALTER TABLE persons_new RENAME TO persons')
         self.conn.commit()
     
-    def register_person(self, name, face_image, hash_size=16):
+    def _invalidate_cache(self):
+        """Marca el índice en memoria como obsoleto tras una escritura"""
+        with self._cache_lock:
+            self._cache_valid = False
+            self._match_cache.clear()
+            self._cache_generation += 1
+    
+    def _ensure_cache(self):
+        """Recarga el índice en memoria solo si alguna escritura lo invalidó"""
+        with self._cache_lock:
+            if self._cache_valid:
+                return self._hash_index
+        
+        # Recargar lee la tabla: primero la conexión, luego el índice
+        with self._conn_lock, self._cache_lock:
+            if not self._cache_valid:
+                self._load_hash_index()
+                self._cache_valid = True
+            return self._hash_index
+    
+    def _load_hash_index(self):
+        """Carga todos los hashes en matrices uint8 para búsqueda vectorizada"""
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT name, hash_normal, hash_flipped, image_path FROM persons')
+        
+        groups = {}
+        for name, hash_normal, hash_flipped, image_path in cursor.fetchall():
+            normal = _hash_to_bytes(hash_normal)
+            flipped = _hash_to_bytes(hash_flipped)
+            if normal is None or flipped is None or len(normal) != len(flipped):
+                continue
+            names, paths, normals, flippeds = groups.setdefault(len(normal), ([], [], [], []))
+            names.append(name)
+            paths.append(image_path)
+            normals.append(normal)
+            flippeds.append(flipped)
+        
+        self._hash_index = {
+            n_bytes: self._build_group(
+                n_bytes, names, paths,
+                np.frombuffer(b''.join(normals), dtype=np.uint8).reshape(-1, n_bytes),
+                np.frombuffer(b''.join(flippeds), dtype=np.uint8).reshape(-1, n_bytes)
+            )
+            for n_bytes, (names, paths, normals, flippeds) in groups.items()
+        }
+    
+    @staticmethod
+    def _build_group(n_bytes, names, paths, hashes_normal, hashes_flipped):
+        """
+        Arma las estructuras de búsqueda de un grupo de hashes de n_bytes
+        
+        Returns:
+            (nombres, rutas, matriz_normal, matriz_volteada, busqueda)
+        """
+        stacked = np.ascontiguousarray(np.vstack([hashes_normal, hashes_flipped]))
+        if FAISS_AVAILABLE:
+            # Búsqueda exacta por Hamming con POPCNT nativo
+            search = faiss.IndexBinaryFlat(n_bytes * 8)
+            search.add(stacked)
+        else:
+            word_type = np.uint64 if n_bytes % 8 == 0 else np.uint8
+            search = stacked.view(word_type)
+        return names, paths, hashes_normal, hashes_flipped, search
+    
+    def _append_to_index(self, rows):
+        """
+        Agrega filas recién insertadas al índice en memoria sin releer la tabla
+        
+        Args:
+            rows: Lista de (nombre, hash_normal, hash_volteado, ruta_imagen) con hashes en bytes
+        """
+        with self._cache_lock:
+            self._match_cache.clear()
+            self._cache_generation += 1
+            if not self._cache_valid:
+                return
+            
+            # Filas nuevas agrupadas por longitud: cada grupo afectado se rearma una
+            # sola vez por llamada (no una vez por fila)
+            added = {}
+            for name, normal, flipped, image_path in rows:
+                names, paths, normals, flippeds = added.setdefault(len(normal), ([], [], [], []))
+                names.append(name)
+                paths.append(image_path)
+                normals.append(normal)
+                flippeds.append(flipped)
+            
+            # Diccionario y grupos nuevos: una búsqueda en curso sigue usando
+            # completo el grupo que ya tomó
+            hash_index = dict(self._hash_index)
+            for n_bytes, (names, paths, normals, flippeds) in added.items():
+                new_normal = np.frombuffer(b''.join(normals), dtype=np.uint8).reshape(-1, n_bytes)
+                new_flipped = np.frombuffer(b''.join(flippeds), dtype=np.uint8).reshape(-1, n_bytes)
+                if n_bytes in hash_index:
+                    old_names, old_paths, hashes_normal, hashes_flipped, _ = hash_index[n_bytes]
+                    names = old_names + names
+                    paths = old_paths + paths
+                    new_normal = np.vstack([hashes_normal, new_normal])
+                    new_flipped = np.vstack([hashes_flipped, new_flipped])
+                hash_index[n_bytes] = self._build_group(n_bytes, names, paths, new_normal, new_flipped)
+            self._hash_index = hash_index
+    
+    def register_person(self, name, face_image, hash_size=16, samples=None):
         """
         Registra una nueva persona en la base de datos
         
@@ -66,53 +317,234 @@ class FaceDatabase:
             name: Nombre de la persona
             face_image: Imagen de la cara (numpy array o PIL Image)
             hash_size: Tamaño del hash para perceptual hashing
+            samples: Otras imágenes de la misma cara (opcional). Se calculan sus
+                hashes en la misma pasada y se guarda el voto mayoritario bit a
+                bit, más estable que el hash de una sola captura
             
         Returns:
             True si se registró exitosamente, False si ya existe
         """
-        cursor = self.conn.cursor()
-        
-        # Verificar si ya existe
-        cursor.execute('SELECT id FROM persons WHERE name = ?', (name,))
-        if cursor.fetchone():
-            return False
-        
         # Convertir a PIL Image si es necesario
+        pil_image = self._to_pil(face_image)
+        pil_samples = [pil_image] + [self._to_pil(sample) for sample in samples or []]
+        
+        # Calcular hashes (todas las muestras en bloque)
+        hashes_normal, hashes_flipped = self._compute_hash_pairs(pil_samples, hash_size)
+        if len(pil_samples) > 1:
+            hash_normal = _majority_hash(hashes_normal)
+            hash_flipped = _majority_hash(hashes_flipped)
+        else:
+            (hash_normal,), (hash_flipped,) = hashes_normal, hashes_flipped
+        
+        # Insertar en una sola transacción; el UNIQUE(name) resuelve si ya existe
+        # sin un SELECT previo
+        image_path = self._image_path_for(name)
+        row = (name, bytes.fromhex(hash_normal), bytes.fromhex(hash_flipped), image_path)
+        with self._conn_lock:
+            with self.conn:
+                cursor = self.conn.execute('''
+                    INSERT OR IGNORE INTO persons (name, hash_normal, hash_flipped, image_path)
+                    VALUES (?, ?, ?, ?)
+                ''', row)
+            if cursor.rowcount == 0:
+                return False
+            
+            # Con la conexión aún tomada: una recarga del índice en otro hilo no
+            # puede leer la fila nueva y después recibirla otra vez aquí
+            self._append_to_index([row])
+            
+            # Guardar imagen en caché antes de soltar la conexión: un delete o
+            # update posterior la encuentra en los guardados pendientes
+            self._save_image_async(pil_image, image_path)
+        return True
+    
+    def register_persons_bulk(self, items, hash_size=16):
+        """
+        Registra varias personas en una sola transacción
+        
+        Args:
+            items: Iterable de (nombre, imagen_cara)
+            hash_size: Tamaño del hash para perceptual hashing
+            
+        Returns:
+            Lista con los nombres registrados (se omiten los que ya existen)
+        """
+        # Solo evita calcular hashes de nombres ya registrados: otro hilo u otro
+        # proceso puede insertar después, así que el INSERT OR IGNORE decide
+        with self._conn_lock:
+            existing = {row[0] for row in self.conn.execute('SELECT name FROM persons')}
+        
+        names = []
+        images = []
+        for name, face_image in items:
+            if name in existing:
+                continue
+            existing.add(name)
+            names.append(name)
+            images.append(self._to_pil(face_image))
+        
+        if not names:
+            return []
+        
+        hashes_normal, hashes_flipped = self._compute_hash_pairs(images, hash_size)
+        
+        # Una transacción con una fila por INSERT: rowcount indica cuáles se
+        # insertaron realmente y los repetidos se omiten sin deshacer el lote
+        inserted = []
+        with self._conn_lock:
+            with self.conn:
+                for name, pil_image, hash_normal, hash_flipped in zip(names, images, hashes_normal, hashes_flipped):
+                    image_path = self._image_path_for(name)
+                    row = (name, bytes.fromhex(hash_normal), bytes.fromhex(hash_flipped), image_path)
+                    cursor = self.conn.execute('''
+                        INSERT OR IGNORE INTO persons (name, hash_normal, hash_flipped, image_path)
+                        VALUES (?, ?, ?, ?)
+                    ''', row)
+                    if cursor.rowcount:
+                        inserted.append((row, pil_image))
+            if inserted:
+                self._append_to_index([row for row, _ in inserted])
+            
+            # Guardar imágenes solo de las filas insertadas (no pisar las existentes)
+            for (_, _, _, image_path), pil_image in inserted:
+                self._save_image_async(pil_image, image_path)
+        return [row[0] for row, _ in inserted]
+    
+    def _to_pil(self, face_image):
+        """Convierte una imagen OpenCV (BGR) a PIL Image si es necesario"""
         if isinstance(face_image, np.ndarray):
             # Convertir de BGR a RGB si viene de OpenCV
             if len(face_image.shape) == 3 and face_image.shape[2] == 3:
                 face_image = cv2.cvtColor(face_image, cv2.COLOR_BGR2RGB)
-            pil_image = Image.fromarray(face_image)
-        else:
-            pil_image = face_image
-        
-        # Calcular hashes
-        hash_normal = self._compute_hash(pil_image, hash_size)
-        
-        # Crear versión volteada y calcular hash
-        flipped = pil_image.transpose(Image.FLIP_LEFT_RIGHT)
-        hash_flipped = self._compute_hash(flipped, hash_size)
-        
-        # Guardar imagen en caché
+            return Image.fromarray(face_image)
+        return face_image
+    
+    def _image_path_for(self, name):
+        """Ruta de la imagen en caché para una persona"""
         image_filename = f"{name.replace(' ', '_').lower()}.jpg"
-        image_path = os.path.join(self.images_cache_dir, image_filename)
-        pil_image.save(image_path, 'JPEG', quality=95)
+        return os.path.join(self.images_cache_dir, image_filename)
+    
+    def _save_image_async(self, pil_image, image_path):
+        """Encola el guardado JPEG de la imagen sin bloquear al llamador"""
+        with self._writes_lock:
+            if self._io_pool is None:
+                self._io_pool = ThreadPoolExecutor(max_workers=1)
+            self._pending_writes = [f for f in self._pending_writes if not f.done()]
+            self._pending_writes.append(
+                self._io_pool.submit(pil_image.save, image_path, 'JPEG', quality=95)
+            )
+    
+    def _flush_pending_writes(self):
+        """Espera a que terminen los guardados de imágenes pendientes"""
+        # Se toma la lista y se espera fuera del lock: los guardados que se
+        # encolen mientras tanto quedan en la lista nueva
+        with self._writes_lock:
+            pending, self._pending_writes = self._pending_writes, []
+        for future in pending:
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Error al guardar imagen: {e}")
+    
+    def _remove_image(self, image_path):
+        """Elimina una imagen de la caché (ignora si ya no existe)"""
+        try:
+            os.unlink(image_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"No se pudo eliminar la imagen {image_path}: {e}")
+    
+    def _compute_hash_pairs(self, pil_images, hash_size, highfreq_factor=4):
+        """
+        Calcula el hash combinado (dhash + phash) normal y espejo de varias imágenes
         
-        # Insertar en la base de datos
-        cursor.execute('''
-            INSERT INTO persons (name, hash_normal, hash_flipped, image_path)
-            VALUES (?, ?, ?, ?)
-        ''', (name, hash_normal, hash_flipped, image_path))
+        Produce los mismos strings que imagehash.dhash + imagehash.phash, pero
+        cada imagen se redimensiona una sola vez por tipo de hash y las
+        comparaciones y la DCT se hacen en bloque con NumPy. El hash espejo se
+        obtiene de los mismos datos: el dhash compara las columnas en orden
+        inverso y en la DCT el espejo horizontal solo cambia el signo de las
+        frecuencias horizontales impares.
         
-        self.conn.commit()
-        return True
+        Args:
+            pil_images: Lista de PIL Images
+            hash_size: Tamaño del hash
+            highfreq_factor: Factor de escala del phash (igual que imagehash)
+            
+        Returns:
+            (lista_hashes_normales, lista_hashes_espejo) como strings hexadecimales
+        """
+        if not pil_images:
+            return [], []
+        
+        n = len(pil_images)
+        img_size = hash_size * highfreq_factor
+        gray = [img.convert('RGB').convert('L') for img in pil_images]
+        
+        # dhash: diferencias horizontales sobre (hash_size, hash_size + 1)
+        small = np.stack([
+            np.asarray(g.resize((hash_size + 1, hash_size), Image.LANCZOS)) for g in gray
+        ])
+        small_flipped = small[:, :, ::-1]
+        dhash_bits = small[:, :, 1:] > small[:, :, :-1]
+        dhash_bits_flipped = small_flipped[:, :, 1:] > small_flipped[:, :, :-1]
+        
+        # phash: DCT 2D de (img_size, img_size) y umbral en la mediana de baja frecuencia
+        big = np.stack([
+            np.asarray(g.resize((img_size, img_size), Image.LANCZOS)) for g in gray
+        ]).astype(np.float64)
+        dct = scipy.fft.dct(scipy.fft.dct(big, axis=1), axis=2)
+        lowfreq = dct[:, :hash_size, :hash_size]
+        lowfreq_flipped = lowfreq * np.where(np.arange(hash_size) % 2 == 0, 1.0, -1.0)
+        
+        def threshold_median(coeffs):
+            median = np.median(coeffs.reshape(n, -1), axis=1).reshape(n, 1, 1)
+            return coeffs > median
+        
+        def to_hex(dhash_bits, phash_bits):
+            dhash_bytes = np.packbits(dhash_bits.reshape(n, -1), axis=1)
+            phash_bytes = np.packbits(phash_bits.reshape(n, -1), axis=1)
+            return [f"{d.tobytes().hex()}{p.tobytes().hex()}" for d, p in zip(dhash_bytes, phash_bytes)]
+        
+        return (
+            to_hex(dhash_bits, threshold_median(lowfreq)),
+            to_hex(dhash_bits_flipped, threshold_median(lowfreq_flipped))
+        )
     
-    def _compute_hash(self, pil_image, hash_size):
-        """Calcula hash combinado (dhash + phash)"""
-        pil_rgb = pil_image.convert('RGB')
-        dhash = str(imagehash.dhash(pil_rgb, hash_size))
-        phash = str(imagehash.phash(pil_rgb, hash_size))
-        return f"{dhash}{phash}"
+    def rehash_all(self, hash_size=16):
+        """
+        Recalcula los hashes de todas las personas a partir de sus imágenes en caché
+        
+        Útil al cambiar hash_size o al reconstruir la base de datos.
+        
+        Returns:
+            Número de personas actualizadas
+        """
+        self._flush_pending_writes()
+        
+        with self._conn_lock:
+            stored = self.conn.execute('SELECT id, image_path FROM persons').fetchall()
+        
+        ids = []
+        images = []
+        for person_id, image_path in stored:
+            if not image_path or not os.path.exists(image_path):
+                continue
+            ids.append(person_id)
+            with Image.open(image_path) as img:
+                images.append(img.convert('RGB'))
+        
+        hashes_normal, hashes_flipped = self._compute_hash_pairs(images, hash_size)
+        
+        with self._conn_lock:
+            self.conn.executemany(
+                'UPDATE persons SET hash_normal = ?, hash_flipped = ? WHERE id = ?',
+                [(bytes.fromhex(n), bytes.fromhex(f), i)
+                 for n, f, i in zip(hashes_normal, hashes_flipped, ids)]
+            )
+            self.conn.commit()
+            self._invalidate_cache()
+        return len(ids)
     
     def find_match(self, face_hash, threshold=102.0):
         """
@@ -125,31 +557,135 @@ class FaceDatabase:
         Returns:
             (nombre, similitud, ruta_imagen) o (None, None, None)
         """
-        cursor = self.conn.cursor()
-        
-        # Obtener todas las personas
-        cursor.execute('SELECT name, hash_normal, hash_flipped, image_path FROM persons')
-        persons = cursor.fetchall()
-        
-        best_match = None
-        best_similarity = float('inf')
-        best_image_path = None
+        query = _hash_to_bytes(face_hash)
+        if query is None:
+            return None, None, None
+        
+        key = (query, float(threshold))
+        cached, generation = self._cached_match(key)
+        if cached is not None:
+            return cached
+        
+        result = self._find_match_uncached(query, threshold)
+        self._store_match(key, result, generation)
+        return result
+    
+    def _find_match_uncached(self, query, threshold):
+        """Búsqueda de un hash (bytes) contra el índice en memoria"""
+        # Todo lo que sigue usa solo esta tupla (nombres, matrices e índice juntos)
+        group = self._ensure_cache().get(len(query))
+        if group is None:
+            return None, None, None
+        
+        names, paths, hashes_normal, hashes_flipped, search = group
+        query = np.frombuffer(query, dtype=np.uint8)
+        
+        if FAISS_AVAILABLE:
+            # Vecino más cercano entre normales y volteados en una sola búsqueda
+            distances, labels = search.search(query.reshape(1, -1), 1)
+            best_similarity = int(distances[0, 0])
+            best_idx = int(labels[0, 0]) % len(names)
+            return self._match_result(names[best_idx], best_similarity,
+                                      paths[best_idx], threshold)
+        
+        # Distancia de Hamming contra todas las personas a la vez (normal y volteado)
+        dist_normal = POPCOUNT_LUT[hashes_normal ^ query].sum(axis=1)
+        dist_flipped = POPCOUNT_LUT[hashes_flipped ^ query].sum(axis=1)
+        distances = np.minimum(dist_normal, dist_flipped)
+        
+        best_idx = int(np.argmin(distances))
+        best_similarity = int(distances[best_idx])
+        return self._match_result(names[best_idx], best_similarity,
+                                  paths[best_idx], threshold)
+    
+    def find_matches_batch(self, face_hashes, threshold=102.0):
+        """
+        Busca coincidencias para varios hashes en una sola pasada
         
-        for name, hash_normal, hash_flipped, image_path in persons:
-            # Calcular similitud con hash normal
-            sim_normal = self._hamming_distance(face_hash, hash_normal)
+        Args:
+            face_hashes: Lista de hashes (hex o bytes) a buscar
+            threshold: Umbral de similitud (distancia Hamming máxima)
             
-            # Calcular similitud con hash volteado
-            sim_flipped = self._hamming_distance(face_hash, hash_flipped)
+        Returns:
+            Lista de (nombre, similitud, ruta_imagen) o (None, None, None), una por hash
+        """
+        results = [(None, None, None)] * len(face_hashes)
+        
+        # Responder desde la caché y agrupar el resto por longitud en bytes
+        hash_index = self._ensure_cache()
+        groups = {}
+        misses = []
+        for i, face_hash in enumerate(face_hashes):
+            query = _hash_to_bytes(face_hash)
+            if query is None:
+                continue
+            key = (query, float(threshold))
+            cached, generation = self._cached_match(key)
+            if cached is not None:
+                results[i] = cached
+                continue
+            misses.append((i, key, generation))
+            if len(query) in hash_index:
+                positions, queries = groups.setdefault(len(query), ([], []))
+                positions.append(i)
+                queries.append(query)
+        
+        for n_bytes, (positions, queries) in groups.items():
+            # Nombres e índice salen de la misma tupla del grupo
+            names, paths, _, _, search = hash_index[n_bytes]
+            queries = np.frombuffer(b''.join(queries), dtype=np.uint8).reshape(-1, n_bytes)
             
-            # Tomar la mejor similitud
-            sim = min(sim_normal, sim_flipped)
+            if FAISS_AVAILABLE:
+                distances, labels = search.search(queries, 1)
+                best_distances = distances[:, 0]
+                best_rows = labels[:, 0] % len(names)
+            elif NUMBA_AVAILABLE and search.dtype == np.uint64:
+                # Kernel compilado: distancias y mínimo en una sola pasada
+                best_rows, best_distances = hamming_best_match_numba(
+                    queries.view(np.uint64), search, len(names)
+                )
+            else:
+                # Un solo XOR (consultas, 2 * personas, palabras) sobre uint64 y
+                # conteo de bits con la tabla sobre la vista en bytes
+                words = search
+                xor = queries.view(words.dtype)[:, None, :] ^ words[None, :, :]
+                dist_all = POPCOUNT_LUT[xor.view(np.uint8)].sum(axis=2)
+                distances = np.minimum(dist_all[:, :len(names)], dist_all[:, len(names):])
+                best_rows = np.argmin(distances, axis=1)
+                best_distances = distances[np.arange(len(queries)), best_rows]
             
-            if sim < best_similarity:
-                best_similarity = sim
-                best_match = name
-                best_image_path = image_path
+            for i, row, distance in zip(positions, best_rows.tolist(), best_distances.tolist()):
+                results[i] = self._match_result(names[row], int(distance), paths[row], threshold)
+        
+        for i, key, generation in misses:
+            self._store_match(key, results[i], generation)
+        
+        return results
+    
+    def _cached_match(self, key):
+        """
+        Consulta la caché de resultados
         
+        Returns:
+            (resultado o None, generación actual del índice)
+        """
+        with self._cache_lock:
+            result = self._match_cache.get(key)
+            if result is not None:
+                self._match_cache.move_to_end(key)
+            return result, self._cache_generation
+    
+    def _store_match(self, key, result, generation):
+        """Guarda un resultado si el índice no cambió mientras se calculaba"""
+        with self._cache_lock:
+            if generation != self._cache_generation:
+                return
+            self._match_cache[key] = result
+            if len(self._match_cache) > MATCH_CACHE_SIZE:
+                self._match_cache.popitem(last=False)
+    
+    def _match_result(self, best_match, best_similarity, best_image_path, threshold):
+        """Convierte la mejor distancia en (nombre, similitud, ruta_imagen) según el umbral"""
         # Retornar solo si está dentro del umbral
         if best_match and best_similarity <= threshold:
             # Convertir similitud a porcentaje (0-100)
@@ -159,103 +695,87 @@ class FaceDatabase:
         
         return None, None, None
     
-    def _hamming_distance(self, hash1, hash2):
-        """Calcula la distancia de Hamming entre dos hashes"""
-        if len(hash1) != len(hash2):
-            return float('inf')
-        
-        distance = 0
-        for c1, c2 in zip(hash1, hash2):
-            if c1 != c2:
-                # Convertir hex a binario y contar bits diferentes
-                val1 = int(c1, 16) if c1.isdigit() or c1.lower() in 'abcdef' else 0
-                val2 = int(c2, 16) if c2.isdigit() or c2.lower() in 'abcdef' else 0
-                xor = val1 ^ val2
-                distance += bin(xor).count('1')
-        
-        return distance
-    
     def get_all_persons(self):
         """Obtiene lista de todas las personas registradas"""
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT id, name, image_path FROM persons ORDER BY name')
-        return cursor.fetchall()
+        with self._conn_lock:
+            return self.conn.execute('SELECT id, name, image_path FROM persons ORDER BY name').fetchall()
     
     def delete_person(self, name):
         """Elimina una persona de la base de datos"""
-        cursor = self.conn.cursor()
-        
-        # Obtener ruta de imagen
-        cursor.execute('SELECT image_path FROM persons WHERE name = ?', (name,))
-        result = cursor.fetchone()
-        
-        if result:
-            image_path = result[0]
+        with self._conn_lock:
+            cursor = self.conn.cursor()
             
-            # Eliminar imagen si existe
-            if image_path and os.path.exists(image_path):
-                try:
-                    os.remove(image_path)
-                except:
-                    pass
+            # Obtener ruta de imagen
+            cursor.execute('SELECT image_path FROM persons WHERE name = ?', (name,))
+            result = cursor.fetchone()
             
-            # Eliminar de BD
-            cursor.execute('DELETE FROM persons WHERE name = ?', (name,))
-            self.conn.commit()
-            return True
-        
-        return False
+            if result:
+                image_path = result[0]
+            
+                # Eliminar imagen si existe (tras terminar cualquier guardado pendiente)
+                self._flush_pending_writes()
+                if image_path:
+                    self._remove_image(image_path)
+            
+                # Eliminar de BD
+                cursor.execute('DELETE FROM persons WHERE name = ?', (name,))
+                self.conn.commit()
+                self._invalidate_cache()
+                return True
+            
+            return False
     
     def update_person_image(self, name, new_face_image, hash_size=16):
         """Actualiza la imagen y hashes de una persona"""
-        cursor = self.conn.cursor()
-        
-        # Verificar que existe
-        cursor.execute('SELECT id, image_path FROM persons WHERE name = ?', (name,))
-        result = cursor.fetchone()
-        
-        if not result:
-            return False
-        
-        person_id, old_image_path = result
-        
-        # Eliminar imagen antigua
-        if old_image_path and os.path.exists(old_image_path):
-            try:
-                os.remove(old_image_path)
-            except:
-                pass
-        
-        # Procesar nueva imagen
-        if isinstance(new_face_image, np.ndarray):
-            if len(new_face_image.shape) == 3 and new_face_image.shape[2] == 3:
-                new_face_image = cv2.cvtColor(new_face_image, cv2.COLOR_BGR2RGB)
-            pil_image = Image.fromarray(new_face_image)
-        else:
-            pil_image = new_face_image
-        
-        # Calcular nuevos hashes
-        hash_normal = self._compute_hash(pil_image, hash_size)
-        flipped = pil_image.transpose(Image.FLIP_LEFT_RIGHT)
-        hash_flipped = self._compute_hash(flipped, hash_size)
-        
-        # Guardar nueva imagen
-        image_filename = f"{name.replace(' ', '_').lower()}.jpg"
-        image_path = os.path.join(self.images_cache_dir, image_filename)
-        pil_image.save(image_path, 'JPEG', quality=95)
-        
-        # Actualizar en BD
-        cursor.execute('''
-            UPDATE persons 
-            SET hash_normal = ?, hash_flipped = ?, image_path = ?
-            WHERE id = ?
-        ''', (hash_normal, hash_flipped, image_path, person_id))
-        
-        self.conn.commit()
-        return True
+        with self._conn_lock:
+            cursor = self.conn.cursor()
+            
+            # Verificar que existe
+            cursor.execute('SELECT id, image_path FROM persons WHERE name = ?', (name,))
+            result = cursor.fetchone()
+            
+            if not result:
+                return False
+            
+            person_id, old_image_path = result
+            
+            # Eliminar imagen antigua (tras terminar cualquier guardado pendiente)
+            self._flush_pending_writes()
+            if old_image_path:
+                self._remove_image(old_image_path)
+            
+            # Procesar nueva imagen
+            pil_image = self._to_pil(new_face_image)
+            
+            # Calcular nuevos hashes
+            (hash_normal,), (hash_flipped,) = self._compute_hash_pairs([pil_image], hash_size)
+            
+            # Guardar nueva imagen
+            image_path = self._image_path_for(name)
+            self._save_image_async(pil_image, image_path)
+            
+            # Actualizar en BD
+            cursor.execute('''
+                UPDATE persons 
+                SET hash_normal = ?, hash_flipped = ?, image_path = ?
+                WHERE id = ?
+            ''', (bytes.fromhex(hash_normal), bytes.fromhex(hash_flipped), image_path, person_id))
+            
+            self.conn.commit()
+            self._invalidate_cache()
+            return True
     
     def close(self):
         """Cierra la conexión a la base de datos"""
-        if self.conn:
-            self.conn.close()
-            self.conn = None
+        self._flush_pending_writes()
+        with self._writes_lock:
+            if self._io_pool is not None:
+                self._io_pool.shutdown(wait=True)
+                self._io_pool = None
+        
+        with self._conn_lock:
+            if self.conn:
+                # Refresca las estadísticas del planificador solo si hace falta
+                self.conn.execute('PRAGMA optimize')
+                self.conn.close()
+                self.conn = None
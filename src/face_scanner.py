@@ -1,14 +1,24 @@
+import gc
+import threading
+import time
+from collections import deque
 import cv2
 import numpy as np
+import torch
 from detector import Detector
 from face_database import FaceDatabase
 import face_utils as utils
+import face_utils_numba
 
 
 class FaceScanner:
     """Clase base para escáneres de reconocimiento facial"""
 
-    def __init__(self, path_weights, size, confidence, iou, hash_size, db_path):
+    # Máximo de caras procesadas por frame (las de mayor confianza; None = todas)
+    max_faces = 10
+
+    def __init__(self, path_weights, size, confidence, iou, hash_size, db_path, sqlite_pragmas=None,
+                 detector_options=None):
         """
         Args:
             path_weights: Ruta a los pesos del modelo YOLO
@@ -17,87 +27,231 @@ class FaceScanner:
             iou: Umbral de IOU
             hash_size: Tamaño del hash
             db_path: Ruta a la base de datos SQLite
+            sqlite_pragmas: PRAGMAs de SQLite adicionales a los por defecto (opcional)
+            detector_options: Argumentos extra del detector, p. ej. use_tensorrt,
+                precision o half (opcional)
         """
-        self.detector = Detector(path_weights)
+        # Un engine TensorRT se exporta al mismo tamaño con que se detecta
+        detector_options = dict(detector_options or {})
+        detector_options.setdefault('imgsz', size)
+        self.detector = Detector(path_weights, **detector_options)
+        
+        # Compilar los kernels de tracking ahora para no pagar el JIT en el primer frame
+        face_utils_numba.warmup()
+        
         self.size = size
         self.confidence = confidence
         self.iou = iou
         self.hash_size = hash_size
         
         # Inicializar base de datos
-        self.db = FaceDatabase(db_path, images_cache_dir="data/face_images")
+        self.db = FaceDatabase(db_path, images_cache_dir="data/face_images", pragmas=sqlite_pragmas)
         self.db.connect()
 
+    def release_model(self):
+        """
+        Libera el modelo YOLO (memoria de GPU/CPU) conservando la base de datos
+        
+        Pensado para el cierre de la aplicación: el scanner se reutiliza entre
+        inicios y paradas de la cámara para no recargar los pesos cada vez.
+        """
+        if self.detector is None:
+            return
+        self.detector.close()
+        self.detector = None
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    @staticmethod
+    def _person_summary(track_data):
+        """Campos de un track que se conservan por persona detectada (sin clonar el track)"""
+        return {
+            'similarity': track_data.get('similarity', 0),
+            'face_image': track_data.get('face_image'),
+            'db_image_path': track_data.get('db_image_path'),
+            'is_unknown': track_data.get('is_unknown', False)
+        }
+
 
 class LiveFaceScanner(FaceScanner):
     """Scanner para reconocimiento facial en vivo desde webcam"""
 
-    def __init__(self, path_weights, size, confidence, iou, hash_size, db_path):
-        super().__init__(path_weights, size, confidence, iou, hash_size, db_path)
+    # Presupuesto por frame: si se supera de forma sostenida se reduce la
+    # resolución de detección (el dibujo sigue a la resolución de la cámara)
+    slow_frame_ms = 40.0
+    slow_frame_patience = 10
+    live_size_step = 0.8
+    min_live_size = 320
+    
+    # Frames sin movimiento (diferencia media de una miniatura gris) reutilizan
+    # las detecciones anteriores; cada static_refresh_every se detecta igual
+    motion_thumb_size = 64
+    motion_threshold = 2.5
+    static_refresh_every = 15
+    
+    # Detectar solo uno de cada infer_stride frames; el resto redibuja las
+    # caras rastreadas sobre el frame nuevo (1 = detectar en todos)
+    infer_stride = 1
+    
+    # Últimas capturas guardadas por cada desconocido para registrarlo con varias muestras
+    unknown_samples_max = 8
+
+    def __init__(self, path_weights, size, confidence, iou, hash_size, db_path, sqlite_pragmas=None,
+                 detector_options=None):
+        super().__init__(path_weights, size, confidence, iou, hash_size, db_path, sqlite_pragmas,
+                         detector_options)
+        self.live_size = size  # Lado actual de la entrada de detección
+        self._slow_frames = 0
+        self._prev_thumb = None
+        self._static_frames = 0
+        self._frame_counter = 0
         self.tracker = {
             'last_id': 0,
             'faces': {}  # Diccionario de caras rastreadas
         }
         self.detected_persons = {}  # Personas únicas detectadas {person_id: data}
+        self._persons_log = []  # (nombre, es_nueva) en el orden en que se agregaron/mejoraron
+        self._unknown_samples = {}  # {nombre_desconocido: deque de caras recientes}
+        
+        # process_frame corre en el hilo de inferencia y la GUI consulta/resetea
+        # desde el suyo: el lock protege tracker, detected_persons, _persons_log,
+        # _unknown_samples y _prev_thumb (la detección YOLO queda fuera)
+        self._state_lock = threading.Lock()
+        
+        # Buffer reutilizado para el frame redimensionado (evita una asignación por frame)
+        self._resize_buf = np.empty((size, size, 3), dtype=np.uint8)
 
-    def process_frame(self, frame):
+    def process_frame(self, frame, in_place=True):
         """
         Procesa un frame de la webcam para detección facial
         
         Args:
             frame: numpy array (BGR) del frame a procesar
+            in_place: Dibujar directamente sobre frame; False dibuja sobre una copia
             
         Returns:
             frame procesado con las detecciones dibujadas
         """
         if frame is None:
             return None
+        
+        start = time.perf_counter()
 
-        # Hacer copia para dibujar
-        frame_copy = frame.copy()
+        # La detección trabaja sobre una versión redimensionada, así que solo
+        # se copia el frame si el llamador necesita conservarlo intacto
+        frame_copy = frame if in_place else frame.copy()
         
-        # Redimensionar para procesamiento
         h_original, w_original = frame.shape[:2]
-        img_resized = cv2.resize(frame, (self.size, self.size))
+        scale_x = w_original / self.live_size
+        scale_y = h_original / self.live_size
+        
+        # Frame intermedio del stride o escena estática (incluye buffers repetidos
+        # por el driver): solo redibujar las caras ya rastreadas
+        self._frame_counter += 1
+        with self._state_lock:
+            if self._frame_counter % self.infer_stride != 0 or self._is_static(frame):
+                utils.draw_faces(frame_copy, self.tracker, scale_x, scale_y)
+                return frame_copy
+        
+        # Redimensionar para procesamiento
+        img_resized = utils.resize_image(frame, self.live_size, dst=self._resize_buf)
         
         # Detectar caras
-        detections = self.detector.detect_objects(img_resized, self.confidence, self.iou)[0]
-        detections = utils.process_detections(detections)
+        detections = self.detector.detect_objects(
+            img_resized, self.confidence, self.iou, imgsz=self.live_size
+        )[0]
+        detections = utils.process_detections(detections, self.max_faces)
         
-        # Extraer caras y calcular hashes
-        utils.extract_faces(img_resized, detections)
-        utils.hash_faces(detections, self.hash_size)
+        # Desde aquí se lee y modifica el estado compartido con la GUI: un
+        # reset_tracker() espera a que termine el frame en lugar de mezclarse
+        with self._state_lock:
+            # Las caras conocidas que siguen rastreadas conservan su identidad
+            pending = utils.reuse_tracked_matches(detections, self.tracker, self.iou)
+            
+            # Extraer caras y calcular hashes
+            utils.extract_faces(img_resized, pending)
+            utils.hash_faces(pending, self.hash_size)
+            
+            # Buscar coincidencias en la base de datos
+            utils.match_faces(pending, self.db)
+            
+            # Tracking de caras
+            utils.track_faces(detections, self.tracker, self.iou)
+            
+            # Actualizar personas detectadas (sin duplicados)
+            self._update_detected_persons()
+            
+            # Dibujar en el frame original, escalando las bboxes al tamaño original
+            utils.draw_faces(frame_copy, self.tracker, scale_x, scale_y)
+            
+            self._adapt_live_size(time.perf_counter() - start)
+        return frame_copy
+
+    def _is_static(self, frame):
+        """
+        Indica si el frame casi no cambió respecto al anterior
         
-        # Buscar coincidencias en la base de datos
-        utils.match_faces(detections, self.db)
+        Compara miniaturas grises de motion_thumb_size px (unos pocos KB), mucho
+        más barato que una pasada del detector.
         
-        # Tracking de caras
-        utils.track_faces(detections, self.tracker, self.iou)
+        Args:
+            frame: Frame BGR a la resolución de la cámara
+            
+        Returns:
+            True si se pueden reutilizar las detecciones del frame anterior
+        """
+        size = self.motion_thumb_size
+        thumb = cv2.cvtColor(
+            cv2.resize(frame, (size, size), interpolation=cv2.INTER_AREA),
+            cv2.COLOR_BGR2GRAY
+        )
+        prev_thumb = self._prev_thumb
+        self._prev_thumb = thumb
         
-        # Actualizar personas detectadas (sin duplicados)
-        self._update_detected_persons()
+        if prev_thumb is None or self._static_frames >= self.static_refresh_every:
+            self._static_frames = 0
+            return False
         
-        # Escalar coordenadas al tamaño original
-        scale_x = w_original / self.size
-        scale_y = h_original / self.size
+        if cv2.absdiff(thumb, prev_thumb).mean() < self.motion_threshold:
+            self._static_frames += 1
+            return True
         
-        tracker_scaled = {'faces': {}}
-        for track_id, track_data in self.tracker['faces'].items():
-            if 'bbox' in track_data:
-                x, y, w, h = track_data['bbox']
-                track_data_scaled = track_data.copy()
-                track_data_scaled['bbox'] = [
-                    int(x * scale_x),
-                    int(y * scale_y),
-                    int(w * scale_x),
-                    int(h * scale_y)
-                ]
-                tracker_scaled['faces'][track_id] = track_data_scaled
-        
-        # Dibujar en el frame original
-        utils.draw_faces(frame_copy, tracker_scaled)
+        self._static_frames = 0
+        return False
+
+    def _adapt_live_size(self, elapsed):
+        """
+        Reduce la resolución de detección si los frames son lentos de forma sostenida
         
-        return frame_copy
+        Las bboxes del tracker se reescalan a la nueva resolución para que el
+        tracking continúe sin perder identidades.
+        
+        Args:
+            elapsed: Segundos que tomó procesar el último frame
+        """
+        if elapsed * 1000 <= self.slow_frame_ms:
+            self._slow_frames = 0
+            return
+        
+        self._slow_frames += 1
+        if self._slow_frames < self.slow_frame_patience:
+            return
+        self._slow_frames = 0
+        
+        # Múltiplo de 32 (stride de YOLO)
+        new_size = max(self.min_live_size, int(self.live_size * self.live_size_step) // 32 * 32)
+        if new_size >= self.live_size:
+            return
+        
+        ratio = new_size / self.live_size
+        for track_data in self.tracker['faces'].values():
+            track_data['bbox'] = [int(v * ratio) for v in track_data['bbox']]
+            track_data['xyxy'] = [int(v * ratio) for v in track_data['xyxy']]
+        
+        self.live_size = new_size
+        self._resize_buf = np.empty((new_size, new_size, 3), dtype=np.uint8)
+        print(f"Frames lentos: detección reducida a {new_size}px")
 
     def _update_detected_persons(self):
         """Actualiza el diccionario de personas únicas detectadas"""
@@ -105,23 +259,68 @@ class LiveFaceScanner(FaceScanner):
             if 'person_name' in track_data:
                 person_name = track_data['person_name']
                 
+                if track_data.get('is_unknown', False):
+                    self._add_unknown_sample(person_name, track_data.get('face_image'))
+                
                 # Solo agregar si es nueva o actualizar si tiene mejor similitud
                 if person_name not in self.detected_persons:
-                    self.detected_persons[person_name] = track_data.copy()
+                    self.detected_persons[person_name] = self._person_summary(track_data)
+                    self._persons_log.append((person_name, True))
                 else:
                     # Actualizar si la similitud es mejor
                     current_sim = self.detected_persons[person_name].get('similarity', 0)
                     new_sim = track_data.get('similarity', 0)
                     if new_sim > current_sim:
-                        self.detected_persons[person_name] = track_data.copy()
+                        self.detected_persons[person_name] = self._person_summary(track_data)
+                        self._persons_log.append((person_name, False))
 
     def reset_tracker(self):
         """Resetea el tracker y las detecciones"""
-        self.tracker = {
-            'last_id': 0,
-            'faces': {}
+        with self._state_lock:
+            self.tracker = {
+                'last_id': 0,
+                'faces': {}
+            }
+            self.detected_persons = {}
+            self._persons_log = []
+            self._unknown_samples = {}
+            self._prev_thumb = None  # El próximo frame se detecta siempre
+
+    def _add_unknown_sample(self, person_name, face_image):
+        """Guarda la captura más reciente de un desconocido (sin repetir la anterior)"""
+        if face_image is None:
+            return
+        samples = self._unknown_samples.get(person_name)
+        if samples is None:
+            samples = self._unknown_samples[person_name] = deque(maxlen=self.unknown_samples_max)
+        elif samples[-1] is face_image:
+            # Frame estático o identidad reutilizada: es la misma captura
+            return
+        samples.append(face_image)
+
+    def get_unknown_samples(self, person_name):
+        """
+        Capturas recientes de una persona desconocida
+        
+        Args:
+            person_name: Nombre asignado al desconocido (ej: "Desconocido #1")
+            
+        Returns:
+            Lista de caras (numpy arrays), de la más antigua a la más reciente
+        """
+        with self._state_lock:
+            return list(self._unknown_samples.get(person_name, ()))
+
+    @staticmethod
+    def _person_entry(person_name, data):
+        """Diccionario público de una persona detectada"""
+        return {
+            'name': person_name,
+            'similarity': data.get('similarity', 0),
+            'face_image': data.get('face_image'),
+            'db_image_path': data.get('db_image_path'),
+            'is_unknown': data.get('is_unknown', False)
         }
-        self.detected_persons = {}
 
     def get_detected_persons(self):
         """
@@ -130,34 +329,69 @@ class LiveFaceScanner(FaceScanner):
         Returns:
             Lista de diccionarios con información de cada persona
         """
-        persons = []
-        for person_name, data in self.detected_persons.items():
-            persons.append({
-                'name': person_name,
-                'similarity': data.get('similarity', 0),
-                'face_image': data.get('face_image'),
-                'db_image_path': data.get('db_image_path'),
-                'is_unknown': data.get('is_unknown', False)
-            })
-        return persons
+        with self._state_lock:
+            return [self._person_entry(name, data) for name, data in self.detected_persons.items()]
+
+    def get_new_persons_since(self, version):
+        """
+        Retorna solo las personas agregadas o mejoradas desde una versión dada
+        
+        Args:
+            version: Versión devuelta por la llamada anterior (0 al empezar)
+            
+        Returns:
+            (lista_cambios, version_actual). Cada cambio es el diccionario de
+            get_detected_persons() más 'is_new' (primera vez que aparece).
+        """
+        with self._state_lock:
+            log = self._persons_log
+            current = len(log)
+            if version > current:
+                # El tracker se reseteó desde la última consulta
+                version = 0
+            elif version == current:
+                # Sin cambios en el tracker: nada que recorrer ni armar
+                return [], current
+            
+            # Un cambio por persona (con sus datos actuales), en orden de aparición
+            changes = {}
+            for person_name, is_new in log[version:current]:
+                if person_name in changes:
+                    changes[person_name]['is_new'] |= is_new
+                    continue
+                data = self.detected_persons.get(person_name)
+                if data is None:
+                    continue
+                entry = self._person_entry(person_name, data)
+                entry['is_new'] = is_new
+                changes[person_name] = entry
+        
+        return list(changes.values()), current
 
-    def register_new_person(self, person_name, face_image):
+    def register_new_person(self, person_name, face_image, samples=None):
         """
         Registra una nueva persona en la base de datos
         
         Args:
             person_name: Nombre de la persona
             face_image: Imagen de la cara (numpy array)
+            samples: Otras capturas de la misma cara, p. ej. get_unknown_samples() (opcional)
             
         Returns:
             True si se registró exitosamente
         """
-        return self.db.register_person(person_name, face_image, self.hash_size)
+        if samples:
+            # La captura principal ya entra en el voto
+            samples = [sample for sample in samples if sample is not face_image]
+        return self.db.register_person(person_name, face_image, self.hash_size, samples=samples)
 
 
 class ImageFaceScanner(FaceScanner):
     """Scanner para reconocimiento facial en imágenes estáticas"""
 
+    # En fotos grupales se procesan todas las caras (no hay presupuesto por frame)
+    max_faces = None
+
     def process_image(self, file_path):
         """
         Procesa una imagen para detección y reconocimiento facial
@@ -170,11 +404,10 @@ class ImageFaceScanner(FaceScanner):
         """
         # Leer imagen
         img_original = utils.read_image(file_path, self.size)
-        img_original_copy = img_original.copy()
         
         # Detectar caras
         detections = self.detector.detect_objects(img_original, self.confidence, self.iou)[0]
-        detections = utils.process_detections(detections)
+        detections = utils.process_detections(detections, self.max_faces)
 
         # Extraer caras y calcular hashes
         utils.extract_faces(img_original, detections)
@@ -183,17 +416,19 @@ class ImageFaceScanner(FaceScanner):
         # Buscar coincidencias en la base de datos
         utils.match_faces(detections, self.db)
 
-        # Dibujar resultados
-        utils.draw_faces_simple(img_original_copy, detections)
+        # Dibujar resultados (las caras ya se extrajeron a su propio buffer)
+        utils.draw_faces_simple(img_original, detections)
 
-        return img_original_copy, detections
+        return img_original, detections
 
 
 class VideoFaceScanner(FaceScanner):
     """Scanner para reconocimiento facial en videos"""
 
-    def __init__(self, path_weights, size, confidence, iou, hash_size, db_path):
-        super().__init__(path_weights, size, confidence, iou, hash_size, db_path)
+    def __init__(self, path_weights, size, confidence, iou, hash_size, db_path, sqlite_pragmas=None,
+                 detector_options=None):
+        super().__init__(path_weights, size, confidence, iou, hash_size, db_path, sqlite_pragmas,
+                         detector_options)
         self.tracker = {
             'last_id': 0,
             'faces': {}
@@ -214,17 +449,55 @@ class VideoFaceScanner(FaceScanner):
             return None
         
         # Redimensionar frame
-        img_original = cv2.resize(frame, (self.size, self.size))
-        img_original_copy = img_original.copy()
+        img_original = utils.resize_image(frame, self.size)
 
         # Detectar caras
-        detections = self.detector.detect_objects(img_original, self.confidence, self.iou)[0]
-        detections = utils.process_detections(detections)
+        result = self.detector.detect_objects(img_original, self.confidence, self.iou)[0]
+        return self._process_result(img_original, result)
+
+    def process_batch(self, frames):
+        """
+        Procesa varios frames consecutivos con una sola pasada del detector
+        
+        El tracking se sigue actualizando frame a frame en orden.
+        
+        Args:
+            frames: Lista de numpy arrays (BGR) consecutivos del video
+            
+        Returns:
+            Lista de frames procesados con las detecciones dibujadas, uno por
+            frame de entrada (None en la posición de los frames None, igual
+            que process_frame)
+        """
+        valid = [i for i, frame in enumerate(frames) if frame is not None]
+        imgs = [utils.resize_image(frames[i], self.size) for i in valid]
+        results = self.detector.detect_objects_batch(imgs, self.confidence, self.iou)
+        
+        processed = [None] * len(frames)
+        for i, img, result in zip(valid, imgs, results):
+            processed[i] = self._process_result(img, result)
+        return processed
+
+    def _process_result(self, img_original, result):
+        """
+        Reconoce, rastrea y dibuja las caras de un frame ya detectado
+        
+        Args:
+            img_original: Frame redimensionado donde se detectó
+            result: Resultado filtrado del detector para ese frame
+            
+        Returns:
+            frame procesado con las detecciones dibujadas
+        """
+        detections = utils.process_detections(result, self.max_faces)
+        
+        # Las caras conocidas que siguen rastreadas conservan su identidad
+        pending = utils.reuse_tracked_matches(detections, self.tracker, self.iou)
         
         # Extraer caras y calcular hashes
-        utils.extract_faces(img_original, detections)
-        utils.hash_faces(detections, self.hash_size)
-        utils.match_faces(detections, self.db)
+        utils.extract_faces(img_original, pending)
+        utils.hash_faces(pending, self.hash_size)
+        utils.match_faces(pending, self.db)
         
         # Tracking de caras
         utils.track_faces(detections, self.tracker, self.iou)
@@ -232,10 +505,10 @@ class VideoFaceScanner(FaceScanner):
         # Actualizar personas detectadas
         self._update_detected_persons()
         
-        # Dibujar sobre el frame
-        utils.draw_faces(img_original_copy, self.tracker)
+        # Dibujar sobre el frame (las caras ya se extrajeron a su propio buffer)
+        utils.draw_faces(img_original, self.tracker)
 
-        return img_original_copy
+        return img_original
 
     def _update_detected_persons(self):
         """Actualiza el diccionario de personas únicas detectadas"""
@@ -244,12 +517,12 @@ class VideoFaceScanner(FaceScanner):
                 person_name = track_data['person_name']
                 
                 if person_name not in self.detected_persons:
-                    self.detected_persons[person_name] = track_data.copy()
+                    self.detected_persons[person_name] = self._person_summary(track_data)
                 else:
                     current_sim = self.detected_persons[person_name].get('similarity', 0)
                     new_sim = track_data.get('similarity', 0)
                     if new_sim > current_sim:
-                        self.detected_persons[person_name] = track_data.copy()
+                        self.detected_persons[person_name] = self._person_summary(track_data)
 
     def reset_tracker(self):
         """Resetea el tracker"""
@@ -1,22 +1,79 @@
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 import numpy as np
-import imagehash
 from PIL import Image
+import scipy.fft
+import torch
+from scipy.optimize import linear_sum_assignment
+
+from face_utils_numba import NUMBA_AVAILABLE
+if NUMBA_AVAILABLE:
+    from face_utils_numba import pairwise_iou_xywh_numba
+
+
+# Estilo de las etiquetas dibujadas sobre las caras
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+FONT_SCALE = 0.6
+THICKNESS = 2
+COLOR_UNKNOWN = (0, 165, 255)  # Naranja para desconocidos
+COLOR_KNOWN = (0, 255, 0)  # Verde para conocidos
+COLOR_TEXT = (255, 255, 255)
+
+
+# Redimensionado en GPU si OpenCV fue compilado con CUDA (opencv-python de pip no lo incluye)
+try:
+    CUDA_RESIZE = cv2.cuda.getCudaEnabledDeviceCount() > 0
+except (AttributeError, cv2.error):
+    CUDA_RESIZE = False
+
+
+@functools.lru_cache(maxsize=512)
+def _text_size(label):
+    """Tamaño de una etiqueta (las mismas se repiten frame a frame)"""
+    return cv2.getTextSize(label, FONT, FONT_SCALE, THICKNESS)
 
 
 def read_image(path_image, size):
     """Lee y redimensiona una imagen"""
     img = cv2.imread(path_image)
-    img = cv2.resize(img, (size, size))
+    img = resize_image(img, size)
     return img
 
 
-def process_detections(detections):
+def resize_image(image, size, dst=None):
+    """
+    Redimensiona una imagen a (size, size), en GPU si OpenCV tiene soporte CUDA
+    
+    Args:
+        image: Imagen (numpy array)
+        size: Lado de la imagen resultante
+        dst: Buffer (size, size, C) preasignado donde escribir el resultado (opcional)
+        
+    Returns:
+        Imagen redimensionada (numpy array)
+    """
+    # INTER_AREA es más barato y de mejor calidad al reducir; INTER_LINEAR al ampliar
+    h, w = image.shape[:2]
+    interpolation = cv2.INTER_AREA if h > size or w > size else cv2.INTER_LINEAR
+    
+    if CUDA_RESIZE:
+        gpu_image = cv2.cuda_GpuMat()
+        gpu_image.upload(image)
+        gpu_resized = cv2.cuda.resize(gpu_image, (size, size), interpolation=interpolation)
+        return gpu_resized.download() if dst is None else gpu_resized.download(dst)
+    return cv2.resize(image, (size, size), dst=dst, interpolation=interpolation)
+
+
+def process_detections(detections, max_faces=None):
     """
     Procesa las detecciones de YOLO
     
     Args:
         detections: Resultados de YOLO
+        max_faces: Máximo de caras a conservar, las de mayor confianza (None = todas)
         
     Returns:
         Lista de diccionarios con información de detección
@@ -24,63 +81,107 @@ def process_detections(detections):
     if detections.boxes is None or len(detections.boxes) == 0:
         return []
     
+    # Acotar el trabajo por frame (recorte, CLAHE, hashes) a las K más confiables;
+    # las de baja confianza ya las descarta el detector antes de llegar aquí
+    boxes = detections.boxes
+    if max_faces is not None and len(boxes) > max_faces:
+        boxes = boxes[boxes.conf.argsort(descending=True)[:max_faces]]
+    
+    # Decodificar en el dispositivo del modelo: [xywh | xyxy | conf] en una matriz (N, 9)
+    # y una sola transferencia GPU -> CPU
+    xywh = boxes.xywh
+    half_wh = xywh[:, 2:] / 2
+    packed = torch.cat(
+        (xywh, xywh[:, :2] - half_wh, xywh[:, :2] + half_wh, boxes.conf[:, None]), dim=1
+    ).cpu().numpy()
+    
+    xywh = packed[:, :4]
+    xyxy = packed[:, 4:8].astype(np.int32)  # int trunca hacia cero, como int()
+    confs = packed[:, 8]
+    
     processed = []
-    for i, bbox in enumerate(detections.boxes.xywh):
-        x, y, w, h = bbox.cpu().numpy()
-        
-        # Convertir de xywh a xyxy
-        x1 = int(x - w/2)
-        y1 = int(y - h/2)
-        x2 = int(x + w/2)
-        y2 = int(y + h/2)
-        
+    for bbox, box_xyxy, conf in zip(xywh.astype(np.int32).tolist(), xyxy.tolist(), confs.tolist()):
         processed.append({
-            'bbox': [int(x), int(y), int(w), int(h)],  # xywh
-            'xyxy': [x1, y1, x2, y2],  # xyxy para cropping
-            'confidence': float(detections.boxes.conf[i].cpu().numpy())
+            'bbox': bbox,  # xywh
+            'xyxy': box_xyxy,  # xyxy para cropping
+            'confidence': conf
         })
     
     return processed
 
 
+FACE_SIZE = 200
+
+
 def extract_faces(image, detections, padding=0.2):
     """
     Extrae las regiones de caras de la imagen con padding
     
+    Todas las caras se redimensionan dentro de un único bloque contiguo
+    (N, 200, 200, C); 'face_image_original' de cada detección es una vista
+    de ese bloque.
+    
     Args:
         image: Imagen original (numpy array)
         detections: Lista de detecciones procesadas
         padding: Porcentaje de padding alrededor de la cara (default: 0.2 = 20%)
+        
+    Returns:
+        Array (K, 200, 200, C) con las K caras extraídas, en el orden de las detecciones
     """
     h, w = image.shape[:2]
+    faces = np.empty((len(detections), FACE_SIZE, FACE_SIZE) + image.shape[2:], dtype=image.dtype)
+    count = 0
     
-    for det in detections:
-        x1, y1, x2, y2 = det['xyxy']
-        
-        # Agregar padding
-        width = x2 - x1
-        height = y2 - y1
-        
-        pad_w = int(width * padding)
-        pad_h = int(height * padding)
-        
-        x1 = max(0, x1 - pad_w)
-        y1 = max(0, y1 - pad_h)
-        x2 = min(w, x2 + pad_w)
-        y2 = min(h, y2 + pad_h)
-        
+    # Padding y recorte a los bordes para todas las cajas a la vez; ambos
+    # extremos se acotan a [0, w] x [0, h] para que ningún índice quede negativo
+    boxes = np.array([det['xyxy'] for det in detections], dtype=np.int64).reshape(-1, 4)
+    pads = np.tile(((boxes[:, 2:] - boxes[:, :2]) * padding).astype(np.int64), 2)
+    crops = boxes + pads * (-1, -1, 1, 1)
+    crops[:, [0, 2]] = np.clip(crops[:, [0, 2]], 0, w)
+    crops[:, [1, 3]] = np.clip(crops[:, [1, 3]], 0, h)
+    
+    for det, (x1, y1, x2, y2) in zip(detections, crops.tolist()):
         # Extraer cara
         face = image[y1:y2, x1:x2]
         
         if face.size > 0:
-            # Redimensionar a tamaño estándar para hash consistente
-            face_resized = cv2.resize(face, (200, 200))
+            # Redimensionar a tamaño estándar para hash consistente, directo al bloque
+            face_resized = faces[count]
+            cv2.resize(face, (FACE_SIZE, FACE_SIZE), dst=face_resized)
+            count += 1
             
             # Normalizar la imagen para mejor reconocimiento
             face_normalized = normalize_face(face_resized)
             
             det['face_image'] = face_normalized
             det['face_image_original'] = face_resized  # Guardar sin normalizar para visualización
+    
+    return faces[:count]
+
+
+_normalize_local = threading.local()
+
+
+def _normalize_scratch(shape):
+    """
+    Buffers LAB/L y objeto CLAHE reutilizados por hilo para normalize_face
+    
+    Args:
+        shape: Forma (alto, ancho, 3) de la cara a normalizar
+        
+    Returns:
+        Objeto con los atributos lab, l_src, l_dst y clahe
+    """
+    scratch = _normalize_local
+    if getattr(scratch, 'clahe', None) is None:
+        scratch.clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+        scratch.lab = None
+    if scratch.lab is None or scratch.lab.shape != shape:
+        scratch.lab = np.empty(shape, dtype=np.uint8)
+        scratch.l_src = np.empty(shape[:2], dtype=np.uint8)
+        scratch.l_dst = np.empty(shape[:2], dtype=np.uint8)
+    return scratch
 
 
 def normalize_face(face_img):
@@ -94,23 +195,128 @@ def normalize_face(face_img):
     Returns:
         Imagen normalizada
     """
-    # Convertir a LAB para trabajar con luminosidad
-    lab = cv2.cvtColor(face_img, cv2.COLOR_BGR2LAB)
-    l, a, b = cv2.split(lab)
+    scratch = _normalize_scratch(face_img.shape)
+    lab = scratch.lab
     
-    # Ecualización adaptativa de histograma en canal L
-    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-    l_equalized = clahe.apply(l)
+    # Convertir a LAB para trabajar con luminosidad (sobre el buffer del hilo)
+    cv2.cvtColor(face_img, cv2.COLOR_BGR2LAB, dst=lab)
     
-    # Recombinar canales
-    lab_equalized = cv2.merge([l_equalized, a, b])
+    # Ecualización adaptativa de histograma en canal L, sin split/merge:
+    # solo el canal L se copia a un buffer contiguo y se escribe de vuelta
+    np.copyto(scratch.l_src, lab[:, :, 0])
+    scratch.clahe.apply(scratch.l_src, dst=scratch.l_dst)
+    lab[:, :, 0] = scratch.l_dst
     
     # Convertir de vuelta a BGR
-    normalized = cv2.cvtColor(lab_equalized, cv2.COLOR_LAB2BGR)
+    normalized = cv2.cvtColor(lab, cv2.COLOR_LAB2BGR)
     
     return normalized
 
 
+# Pesos BT.601 en punto fijo de 16 bits de PIL convert('L'), en orden B, G, R
+_PIL_LUMA_BGR = np.array([7471, 38470, 19595], dtype=np.uint32)
+
+
+def _gray_like_pil(img):
+    """
+    Convierte una imagen BGR a escala de grises igual que PIL convert('L')
+    
+    cv2.COLOR_BGR2GRAY usa los mismos pesos BT.601 pero redondea distinto,
+    y un nivel de diferencia basta para cambiar bits del dhash/ahash. Se usa
+    la misma fórmula entera que PIL (pesos en 16 bits y redondeo con 0x8000)
+    directamente sobre BGR, sin copia a RGB ni imagen PIL intermedia.
+    
+    Args:
+        img: Imagen BGR (numpy array (H, W, 3))
+        
+    Returns:
+        Imagen en escala de grises (numpy array uint8 (H, W))
+    """
+    luma = img.astype(np.uint32) @ _PIL_LUMA_BGR
+    luma += 0x8000
+    luma >>= 16
+    return luma.astype(np.uint8)
+
+
+def _hash_inputs(img, hash_size, highfreq_factor=4):
+    """
+    Reducciones de una imagen a los tamaños de entrada de los tres hashes
+    
+    Args:
+        img: Imagen (numpy array BGR o ya en escala de grises)
+        hash_size: Tamaño del hash
+        highfreq_factor: Factor de escala del phash (igual que imagehash)
+        
+    Returns:
+        (dhash (hash_size, hash_size + 1), phash (img_size, img_size), ahash (hash_size, hash_size))
+        como arrays uint8
+    """
+    img_size = hash_size * highfreq_factor
+    
+    # Los tres hashes trabajan en escala de grises: convertir una sola vez desde BGR
+    gray = Image.fromarray(img if img.ndim == 2 else _gray_like_pil(img))
+    return (
+        np.asarray(gray.resize((hash_size + 1, hash_size), Image.LANCZOS)),
+        np.asarray(gray.resize((img_size, img_size), Image.LANCZOS)),
+        np.asarray(gray.resize((hash_size, hash_size), Image.LANCZOS))
+    )
+
+
+def _hashes_from_inputs(inputs, hash_size):
+    """
+    dhash + phash + ahash en bloque a partir de las entradas ya reducidas
+    
+    Args:
+        inputs: Lista de tuplas devueltas por _hash_inputs
+        hash_size: Tamaño del hash
+        
+    Returns:
+        Lista de strings con hashes combinados, uno por entrada
+    """
+    if not inputs:
+        return []
+    
+    n = len(inputs)
+    small, big, tiny = (np.stack(arrays) for arrays in zip(*inputs))
+    
+    # dhash: diferencias horizontales sobre (hash_size, hash_size + 1)
+    dhash_bits = small[:, :, 1:] > small[:, :, :-1]
+    
+    # phash: DCT 2D y umbral en la mediana de las frecuencias bajas
+    lowfreq = scipy.fft.dct(scipy.fft.dct(big.astype(np.float64), axis=1), axis=2)[:, :hash_size, :hash_size]
+    phash_bits = lowfreq > np.median(lowfreq.reshape(n, -1), axis=1).reshape(n, 1, 1)
+    
+    # ahash: umbral en la media de la imagen (hash_size, hash_size)
+    ahash_bits = tiny > tiny.reshape(n, -1).mean(axis=1).reshape(n, 1, 1)
+    
+    packed = np.packbits(
+        np.concatenate([b.reshape(n, -1) for b in (dhash_bits, phash_bits, ahash_bits)], axis=1),
+        axis=1
+    )
+    return [row.tobytes().hex() for row in packed]
+
+
+def hash_images_multi(images, hash_size, highfreq_factor=4):
+    """
+    Calcula dhash + phash + ahash de varias imágenes en bloque
+    
+    Produce los mismos strings que imagehash.dhash, imagehash.phash e
+    imagehash.average_hash concatenados, pero la DCT, los umbrales y el
+    empaquetado de bits se hacen una sola vez para todas las imágenes.
+    
+    Args:
+        images: Lista de imágenes (numpy array BGR o ya en escala de grises)
+        hash_size: Tamaño del hash
+        highfreq_factor: Factor de escala del phash (igual que imagehash)
+        
+    Returns:
+        Lista de strings con hashes combinados, uno por imagen
+    """
+    return _hashes_from_inputs(
+        [_hash_inputs(img, hash_size, highfreq_factor) for img in images], hash_size
+    )
+
+
 def hash_image_multi(img, hash_size):
     """
     Calcula múltiples hashes para mejor robustez
@@ -123,17 +329,68 @@ def hash_image_multi(img, hash_size):
     Returns:
         String con hashes combinados
     """
-    # Convertir BGR a RGB
-    img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    pil_img = Image.fromarray(img_rgb)
+    return hash_images_multi([img], hash_size)[0]
+
+
+def _stack_gray(images):
+    """
+    Convierte varias imágenes BGR a escala de grises
     
-    # Calcular múltiples tipos de hash
-    dhash = str(imagehash.dhash(pil_img, hash_size))
-    phash = str(imagehash.phash(pil_img, hash_size))
-    ahash = str(imagehash.average_hash(pil_img, hash_size))
+    Si todas tienen la misma forma (caras de extract_faces), se apilan en un
+    bloque (N, H, W, 3) y se convierten con una sola llamada a _gray_like_pil.
     
-    # Combinar hashes
-    return f'{dhash}{phash}{ahash}'
+    Args:
+        images: Lista de imágenes BGR (numpy array)
+        
+    Returns:
+        Array (N, H, W) o lista de imágenes en escala de grises
+    """
+    shape = images[0].shape
+    if len(shape) != 3 or any(img.shape != shape for img in images):
+        return [_gray_like_pil(img) for img in images]
+    
+    h, w = shape[:2]
+    block = np.stack(images).reshape(len(images) * h, w, 3)
+    return _gray_like_pil(block).reshape(len(images), h, w)
+
+
+HASH_WORKERS = min(4, os.cpu_count() or 1)
+_hash_executor = None
+
+
+def _hash_pool():
+    """Pool de hilos compartido para el hashing de caras (creado bajo demanda)"""
+    global _hash_executor
+    if _hash_executor is None:
+        _hash_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS)
+    return _hash_executor
+
+
+def _hash_variants(grays, hash_size):
+    """
+    Hashes de las 4 variantes (normal, espejo, +5°, -5°) de un bloque de caras
+    
+    Args:
+        grays: Caras en escala de grises
+        hash_size: Tamaño del hash
+        
+    Returns:
+        Lista de 4 * len(grays) hashes, agrupados por cara
+    """
+    inputs = []
+    for gray in grays:
+        base = _hash_inputs(gray, hash_size)
+        inputs.extend((
+            base,                                        # Hash de imagen normalizada
+            _hash_inputs(cv2.flip(gray, 1), hash_size),  # Hash volteado (espejo)
+            # Rotaciones leves para mayor robustez, aplicadas sobre las
+            # entradas ya reducidas en lugar de la cara de 200x200
+            tuple(rotate_image(reduced, 5) for reduced in base),
+            tuple(rotate_image(reduced, -5) for reduced in base)
+        ))
+    
+    # Todas las variantes del bloque en una sola pasada
+    return _hashes_from_inputs(inputs, hash_size)
 
 
 def hash_faces(detections, hash_size):
@@ -144,23 +401,55 @@ def hash_faces(detections, hash_size):
         detections: Lista de detecciones con face_image
         hash_size: Tamaño del hash
     """
-    for det in detections:
-        if 'face_image' in det:
-            # Hash de imagen normalizada
-            det['hash'] = hash_image_multi(det['face_image'], hash_size)
-            
-            # Hash volteado (espejo)
-            flipped = cv2.flip(det['face_image'], 1)
-            det['hash_flipped'] = hash_image_multi(flipped, hash_size)
-            
-            # Hash con rotaciones leves para mayor robustez
-            # Rotación +5 grados
-            rotated_5 = rotate_image(det['face_image'], 5)
-            det['hash_rot5'] = hash_image_multi(rotated_5, hash_size)
-            
-            # Rotación -5 grados
-            rotated_neg5 = rotate_image(det['face_image'], -5)
-            det['hash_rot_neg5'] = hash_image_multi(rotated_neg5, hash_size)
+    hash_keys = ('hash', 'hash_flipped', 'hash_rot5', 'hash_rot_neg5')
+    faces = [det for det in detections if 'face_image' in det]
+    
+    if not faces:
+        return
+    
+    # Escala de grises una sola vez para todas las caras; espejo y rotaciones
+    # se hacen sobre un canal en lugar de tres
+    grays = _stack_gray([det['face_image'] for det in faces])
+    
+    # Repartir las caras en bloques entre hilos: OpenCV, PIL (resize) y la DCT
+    # liberan el GIL, así que los bloques se calculan en paralelo
+    n_chunks = min(len(faces), HASH_WORKERS)
+    if n_chunks > 1:
+        bounds = np.linspace(0, len(faces), n_chunks + 1).astype(int)
+        chunks = [grays[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+        hashes = [
+            h for chunk_hashes in _hash_pool().map(_hash_variants, chunks, [hash_size] * n_chunks)
+            for h in chunk_hashes
+        ]
+    else:
+        hashes = _hash_variants(grays, hash_size)
+    
+    for i, det in enumerate(faces):
+        for j, key in enumerate(hash_keys):
+            det[key] = hashes[i * len(hash_keys) + j]
+
+
+@functools.lru_cache(maxsize=32)
+def _rotation_maps(h, w, angle):
+    """
+    Tablas de remapeo para rotar una imagen (h, w) un ángulo fijo
+    
+    Las caras siempre tienen el mismo tamaño y se rotan con los mismos
+    ángulos, así que la matriz y las tablas se calculan una sola vez.
+    
+    Returns:
+        (map1, map2) en formato de punto fijo para cv2.remap
+    """
+    center = (w // 2, h // 2)
+    
+    # Matriz de rotación y su inversa (destino -> origen, como warpAffine)
+    M = cv2.getRotationMatrix2D(center, angle, 1.0)
+    M_inv = cv2.invertAffineTransform(M)
+    
+    xs, ys = np.meshgrid(np.arange(w, dtype=np.float32), np.arange(h, dtype=np.float32))
+    map_x = (M_inv[0, 0] * xs + M_inv[0, 1] * ys + M_inv[0, 2]).astype(np.float32)
+    map_y = (M_inv[1, 0] * xs + M_inv[1, 1] * ys + M_inv[1, 2]).astype(np.float32)
+    return cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
 
 
 def rotate_image(image, angle):
@@ -175,15 +464,12 @@ def rotate_image(image, angle):
         Imagen rotada
     """
     h, w = image.shape[:2]
-    center = (w // 2, h // 2)
-    
-    # Matriz de rotación
-    M = cv2.getRotationMatrix2D(center, angle, 1.0)
+    map1, map2 = _rotation_maps(h, w, angle)
     
-    # Rotar
-    rotated = cv2.warpAffine(image, M, (w, h), 
-                             flags=cv2.INTER_LINEAR,
-                             borderMode=cv2.BORDER_REPLICATE)
+    # Rotar con las tablas precalculadas
+    rotated = cv2.remap(image, map1, map2,
+                        interpolation=cv2.INTER_LINEAR,
+                        borderMode=cv2.BORDER_REPLICATE)
     
     return rotated
 
@@ -198,43 +484,40 @@ def match_faces(detections, db, threshold=150.0):
         db: Instancia de FaceDatabase
         threshold: Umbral de similitud (default: 150.0 para hashes múltiples)
     """
-    for det in detections:
-        if 'hash' in det:
-            best_match = None
-            best_similarity = 0
-            best_image_path = None
-            
-            # Probar todos los hashes disponibles
-            hash_variants = [
-                ('hash', det.get('hash', '')),
-                ('hash_flipped', det.get('hash_flipped', '')),
-                ('hash_rot5', det.get('hash_rot5', '')),
-                ('hash_rot_neg5', det.get('hash_rot_neg5', ''))
-            ]
-            
-            for variant_name, hash_value in hash_variants:
-                if not hash_value:
-                    continue
-                
-                match, sim, img_path = db.find_match(hash_value, threshold)
-                
-                if match and sim > best_similarity:
-                    best_match = match
-                    best_similarity = sim
-                    best_image_path = img_path
-            
-            # Asignar mejor coincidencia
-            if best_match:
-                det['person_name'] = best_match
-                det['similarity'] = best_similarity
-                det['db_image_path'] = best_image_path
-                det['is_unknown'] = False
-            else:
-                # No se encontró coincidencia - es desconocido
-                det['person_name'] = None
-                det['similarity'] = 0.0
-                det['db_image_path'] = None
-                det['is_unknown'] = True
+    hash_keys = ('hash', 'hash_flipped', 'hash_rot5', 'hash_rot_neg5')
+    
+    # Reunir todas las variantes de hash de todas las caras para una sola consulta
+    pending = [det for det in detections if 'hash' in det]
+    queries = []
+    owners = []
+    for det_idx, det in enumerate(pending):
+        for key in hash_keys:
+            hash_value = det.get(key, '')
+            if hash_value:
+                queries.append(hash_value)
+                owners.append(det_idx)
+    
+    results = db.find_matches_batch(queries, threshold) if queries else []
+    
+    # Elegir la mejor variante de cada cara
+    best = [(None, 0, None)] * len(pending)
+    for det_idx, (match, sim, img_path) in zip(owners, results):
+        if match and sim > best[det_idx][1]:
+            best[det_idx] = (match, sim, img_path)
+    
+    for det, (best_match, best_similarity, best_image_path) in zip(pending, best):
+        # Asignar mejor coincidencia
+        if best_match:
+            det['person_name'] = best_match
+            det['similarity'] = best_similarity
+            det['db_image_path'] = best_image_path
+            det['is_unknown'] = False
+        else:
+            # No se encontró coincidencia - es desconocido
+            det['person_name'] = None
+            det['similarity'] = 0.0
+            det['db_image_path'] = None
+            det['is_unknown'] = True
 
 
 def calcular_iou(bbox1, bbox2):
@@ -285,6 +568,69 @@ def calcular_iou(bbox1, bbox2):
     return iou
 
 
+def pairwise_iou_xywh(tracks_xywh, dets_xywh):
+    """
+    Calcula la matriz de IoU entre dos conjuntos de bounding boxes
+    
+    Args:
+        tracks_xywh: Array (M, 4) en formato xywh
+        dets_xywh: Array (N, 4) en formato xywh
+        
+    Returns:
+        Matriz (M, N) con el IoU de cada par
+    """
+    tracks = np.asarray(tracks_xywh, dtype=np.float64).reshape(-1, 4)
+    dets = np.asarray(dets_xywh, dtype=np.float64).reshape(-1, 4)
+    
+    if NUMBA_AVAILABLE:
+        return pairwise_iou_xywh_numba(tracks, dets)
+    
+    # Convertir a xyxy, con formas (M, 1) y (1, N) para broadcasting
+    t_x1 = (tracks[:, 0] - tracks[:, 2] / 2)[:, None]
+    t_y1 = (tracks[:, 1] - tracks[:, 3] / 2)[:, None]
+    t_x2 = (tracks[:, 0] + tracks[:, 2] / 2)[:, None]
+    t_y2 = (tracks[:, 1] + tracks[:, 3] / 2)[:, None]
+    
+    d_x1 = (dets[:, 0] - dets[:, 2] / 2)[None, :]
+    d_y1 = (dets[:, 1] - dets[:, 3] / 2)[None, :]
+    d_x2 = (dets[:, 0] + dets[:, 2] / 2)[None, :]
+    d_y2 = (dets[:, 1] + dets[:, 3] / 2)[None, :]
+    
+    # Calcular intersección
+    inter_ancho = np.clip(np.minimum(t_x2, d_x2) - np.maximum(t_x1, d_x1), 0, None)
+    inter_alto = np.clip(np.minimum(t_y2, d_y2) - np.maximum(t_y1, d_y1), 0, None)
+    inter_area = inter_ancho * inter_alto
+    
+    # Calcular unión
+    area_t = (tracks[:, 2] * tracks[:, 3])[:, None]
+    area_d = (dets[:, 2] * dets[:, 3])[None, :]
+    union_area = area_t + area_d - inter_area
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        iou = np.where(union_area > 0, inter_area / union_area, 0.0)
+    
+    return iou
+
+
+# Tablas para comparar hashes hexadecimales carácter a carácter
+HEX_VALUES = {c: int(c, 16) for c in '0123456789abcdefABCDEF'}
+NIBBLE_POPCOUNT = [bin(i).count('1') for i in range(16)]
+
+
+@functools.lru_cache(maxsize=4096)
+def _hex_to_int(hash_hex):
+    """
+    Entero de un hash hexadecimal (None si no es válido)
+    
+    Los hashes de las caras rastreadas se comparan frame a frame contra cada
+    detección nueva, así que cada string se convierte una sola vez.
+    """
+    try:
+        return int(hash_hex, 16)
+    except ValueError:
+        return None
+
+
 def hamming_distance(hash1, hash2):
     """
     Calcula la distancia de Hamming entre dos hashes
@@ -298,20 +644,109 @@ def hamming_distance(hash1, hash2):
     if not hash1 or not hash2 or len(hash1) != len(hash2):
         return float('inf')
     
+    # Camino rápido: XOR de los hashes completos como enteros y conteo de bits en C
+    # (int.bit_count requiere Python 3.10; bin().count funciona desde 3.8)
+    value1 = _hex_to_int(hash1)
+    value2 = _hex_to_int(hash2)
+    if value1 is not None and value2 is not None:
+        return bin(value1 ^ value2).count('1')
+    
+    # Hashes con caracteres no hexadecimales: comparar carácter a carácter con
+    # tablas (4 bits de penalización por cada carácter inválido distinto)
     distance = 0
     for c1, c2 in zip(hash1, hash2):
         if c1 != c2:
-            try:
-                val1 = int(c1, 16)
-                val2 = int(c2, 16)
-                xor = val1 ^ val2
-                distance += bin(xor).count('1')
-            except ValueError:
+            val1 = HEX_VALUES.get(c1)
+            val2 = HEX_VALUES.get(c2)
+            if val1 is None or val2 is None:
                 distance += 4
+            else:
+                distance += NIBBLE_POPCOUNT[val1 ^ val2]
     
     return distance
 
 
+def _assign_tracks(track_items, detections, iou_threshold):
+    """
+    Asocia caras rastreadas con detecciones por IoU
+    
+    Args:
+        track_items: Lista de (track_id, datos_track)
+        detections: Lista de detecciones del frame actual
+        iou_threshold: Umbral de IoU para considerar match espacial
+        
+    Returns:
+        Diccionario {índice_track: índice_detección}
+    """
+    if not track_items or not detections:
+        return {}
+    
+    # Matriz de IoU entre todas las caras rastreadas y las nuevas detecciones
+    iou_matrix = pairwise_iou_xywh(
+        [tracked_face['bbox'] for _, tracked_face in track_items],
+        [det['bbox'] for det in detections]
+    )
+    
+    # Asignación óptima (húngaro) que maximiza el IoU total; los pares bajo el
+    # umbral no aportan y se descartan después
+    valid = iou_matrix > iou_threshold
+    if not valid.any():
+        return {}
+    
+    # Con un solo par posible no hace falta resolver la asignación
+    if valid.sum() == 1:
+        r, c = np.argwhere(valid)[0]
+        return {int(r): int(c)}
+    
+    rows, cols = linear_sum_assignment(np.where(valid, -iou_matrix, 0.0))
+    return {int(r): int(c) for r, c in zip(rows, cols) if valid[r, c]}
+
+
+def reuse_tracked_matches(detections, tracker, iou_threshold=0.5, refresh_every=30):
+    """
+    Reutiliza la identidad de las caras conocidas que siguen rastreadas
+    
+    Las detecciones que coinciden por IoU con un track de una persona conocida
+    heredan su hash, imagen y resultado de la base de datos, evitando volver a
+    extraer, calcular hashes y buscar en la BD. Cada refresh_every frames la
+    identidad se vuelve a verificar.
+    
+    Args:
+        detections: Nuevas detecciones del frame actual
+        tracker: Diccionario con estado del tracker
+        iou_threshold: Umbral de IoU para considerar match espacial
+        refresh_every: Frames tras los cuales se recalcula la identidad
+        
+    Returns:
+        Lista de detecciones que requieren el procesamiento completo
+    """
+    track_items = list(tracker['faces'].items())
+    assignment = _assign_tracks(track_items, detections, iou_threshold)
+    reused = set()
+    
+    for row, det_idx in assignment.items():
+        tracked_face = track_items[row][1]
+        if tracked_face.get('is_unknown', True) or not tracked_face.get('person_name'):
+            continue
+        
+        age = tracked_face.get('identified_age', 0) + 1
+        if age >= refresh_every:
+            continue
+        
+        det = detections[det_idx]
+        det['face_image_original'] = tracked_face.get('face_image')
+        det['hash'] = tracked_face.get('hash')
+        det['hash_flipped'] = tracked_face.get('hash_flipped')
+        det['person_name'] = tracked_face['person_name']
+        det['similarity'] = tracked_face.get('similarity', 0)
+        det['db_image_path'] = tracked_face.get('db_image_path')
+        det['is_unknown'] = False
+        det['identified_age'] = age
+        reused.add(det_idx)
+    
+    return [det for i, det in enumerate(detections) if i not in reused]
+
+
 def track_faces(detections, tracker, iou_threshold=0.5, unknown_similarity_threshold=80.0):
     """
     Rastrea caras entre frames para mantener IDs consistentes
@@ -326,20 +761,12 @@ def track_faces(detections, tracker, iou_threshold=0.5, unknown_similarity_thres
     new_faces = {}
     matched_detections = set()
     
+    track_items = list(tracker['faces'].items())
+    assignment = _assign_tracks(track_items, detections, iou_threshold)
+    
     # Intentar hacer match con caras existentes
-    for track_id, tracked_face in tracker['faces'].items():
-        best_iou = 0
-        best_det_idx = -1
-        
-        for i, det in enumerate(detections):
-            if i in matched_detections:
-                continue
-            
-            iou = calcular_iou(tracked_face['bbox'], det['bbox'])
-            
-            if iou > iou_threshold and iou > best_iou:
-                best_iou = iou
-                best_det_idx = i
+    for row, (track_id, tracked_face) in enumerate(track_items):
+        best_det_idx = assignment.get(row, -1)
         
         # Si encontramos match espacial, actualizar
         if best_det_idx >= 0:
@@ -357,7 +784,8 @@ def track_faces(detections, tracker, iou_threshold=0.5, unknown_similarity_thres
                 'similarity': det.get('similarity', 0),
                 'db_image_path': det.get('db_image_path'),
                 'is_unknown': det.get('is_unknown', False),
-                'confidence': det.get('confidence', 0.0)
+                'confidence': det.get('confidence', 0.0),
+                'identified_age': det.get('identified_age', 0)
             }
     
     # Agregar nuevas detecciones que no hicieron match
@@ -394,7 +822,8 @@ def track_faces(detections, tracker, iou_threshold=0.5, unknown_similarity_thres
                         'similarity': 0.0,
                         'db_image_path': None,
                         'is_unknown': True,
-                        'confidence': det.get('confidence', 0.0)
+                        'confidence': det.get('confidence', 0.0),
+                        'identified_age': 0
                     }
                     continue
                 
@@ -412,7 +841,8 @@ def track_faces(detections, tracker, iou_threshold=0.5, unknown_similarity_thres
                     'similarity': 0.0,
                     'db_image_path': None,
                     'is_unknown': True,
-                    'confidence': det.get('confidence', 0.0)
+                    'confidence': det.get('confidence', 0.0),
+                    'identified_age': 0
                 }
                 
                 tracker['last_id'] += 1
@@ -430,7 +860,8 @@ def track_faces(detections, tracker, iou_threshold=0.5, unknown_similarity_thres
                     'similarity': det.get('similarity', 0),
                     'db_image_path': det.get('db_image_path'),
                     'is_unknown': False,
-                    'confidence': det.get('confidence', 0.0)
+                    'confidence': det.get('confidence', 0.0),
+                    'identified_age': 0
                 }
                 
                 tracker['last_id'] += 1
@@ -439,29 +870,114 @@ def track_faces(detections, tracker, iou_threshold=0.5, unknown_similarity_thres
     tracker['faces'] = new_faces
 
 
-def draw_faces(image, tracker):
+@functools.lru_cache(maxsize=128)
+def _render_label(label, color):
+    """
+    Renderiza una etiqueta (fondo + texto) una sola vez
+    
+    Las etiquetas de las personas rastreadas se repiten frame a frame, así que
+    se dibujan sobre una tira propia y luego solo se copian a la imagen.
+    
+    Args:
+        label: Texto de la etiqueta
+        color: Color BGR del fondo
+        
+    Returns:
+        (tira BGR, máscara del texto, alto del fondo). Las filas por debajo del
+        fondo solo contienen los descendentes del texto (se copian según la máscara)
+    """
+    (text_width, text_height), baseline = _text_size(label)
+    bg_height = text_height + 11
+    strip_height = bg_height + baseline + THICKNESS
+    strip_width = text_width + 11
+    
+    # Mismos píxeles que el rectángulo relleno entre (x1, y1 - th - 10) y (x1 + tw + 10, y1)
+    strip = np.zeros((strip_height, strip_width, 3), dtype=np.uint8)
+    strip[:bg_height] = color
+    origin = (5, bg_height - 6)
+    cv2.putText(strip, label, origin, FONT, FONT_SCALE, COLOR_TEXT, THICKNESS, cv2.LINE_AA)
+    
+    mask = np.zeros((strip_height, strip_width), dtype=np.uint8)
+    cv2.putText(mask, label, origin, FONT, FONT_SCALE, 255, THICKNESS, cv2.LINE_AA)
+    
+    strip.setflags(write=False)
+    mask = mask > 0
+    mask.setflags(write=False)
+    return strip, mask, bg_height
+
+
+def _draw_label(image, label, x1, y1, color):
+    """
+    Copia la etiqueta precalculada sobre la esquina superior de la caja
+    
+    Args:
+        image: Imagen donde dibujar
+        label: Texto de la etiqueta
+        x1, y1: Esquina superior izquierda de la caja de la cara
+        color: Color BGR del fondo
+    """
+    strip, mask, bg_height = _render_label(label, color)
+    top = y1 - bg_height + 1
+    
+    # Recortar la tira a los bordes de la imagen
+    img_h, img_w = image.shape[:2]
+    y_start, x_start = max(0, top), max(0, x1)
+    y_end = min(img_h, top + strip.shape[0])
+    x_end = min(img_w, x1 + strip.shape[1])
+    if y_start >= y_end or x_start >= x_end:
+        return
+    
+    strip = strip[y_start - top:y_end - top, x_start - x1:x_end - x1]
+    mask = mask[y_start - top:y_end - top, x_start - x1:x_end - x1]
+    region = image[y_start:y_end, x_start:x_end]
+    
+    # Fondo completo + descendentes del texto por debajo del fondo
+    bg_rows = max(0, min(bg_height - (y_start - top), region.shape[0]))
+    region[:bg_rows] = strip[:bg_rows]
+    region[bg_rows:][mask[bg_rows:]] = strip[bg_rows:][mask[bg_rows:]]
+
+
+def _bboxes_to_xyxy(bboxes, scale_x=1.0, scale_y=1.0):
+    """
+    Escala bboxes xywh y las convierte a xyxy enteras en una sola operación
+    
+    Args:
+        bboxes: Lista o array (N, 4) en formato xywh
+        scale_x: Factor horizontal
+        scale_y: Factor vertical
+        
+    Returns:
+        Lista de [x1, y1, x2, y2] (trunca hacia cero, como int())
+    """
+    bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+    bboxes = (bboxes * (scale_x, scale_y, scale_x, scale_y)).astype(np.int32)
+    half_wh = bboxes[:, 2:] / 2
+    return np.concatenate(
+        [bboxes[:, :2] - half_wh, bboxes[:, :2] + half_wh], axis=1
+    ).astype(np.int32).tolist()
+
+
+def draw_faces(image, tracker, scale_x=1.0, scale_y=1.0):
     """
     Dibuja las caras detectadas en la imagen con nombres y confianza
     
     Args:
         image: Imagen donde dibujar
         tracker: Diccionario con caras rastreadas
+        scale_x: Factor horizontal de las bboxes del tracker a la imagen
+        scale_y: Factor vertical de las bboxes del tracker a la imagen
     """
-    for track_id, face_data in tracker['faces'].items():
-        x, y, w, h = face_data['bbox']
-        
-        # Calcular coordenadas del rectángulo
-        x1 = int(x - w/2)
-        y1 = int(y - h/2)
-        x2 = int(x + w/2)
-        y2 = int(y + h/2)
-        
+    faces = [face_data for face_data in tracker['faces'].values() if 'bbox' in face_data]
+    if not faces:
+        return
+    
+    # Escalar y convertir todas las bboxes a xyxy de una vez
+    boxes_xyxy = _bboxes_to_xyxy([face_data['bbox'] for face_data in faces], scale_x, scale_y)
+    
+    for face_data, (x1, y1, x2, y2) in zip(faces, boxes_xyxy):
         # Determinar color basado en si es conocido o desconocido
         is_unknown = face_data.get('is_unknown', True)
-        if is_unknown:
-            color = (0, 165, 255)  # Naranja para desconocidos
-        else:
-            color = (0, 255, 0)  # Verde para conocidos
+        color = COLOR_UNKNOWN if is_unknown else COLOR_KNOWN
         
         # Dibujar rectángulo
         cv2.rectangle(image, (x1, y1), (x2, y2), color, 2)
@@ -476,35 +992,8 @@ def draw_faces(image, tracker):
         else:
             label = f"{person_name} ({similarity:.0f}%)"
         
-        # Dibujar fondo para el texto
-        font = cv2.FONT_HERSHEY_SIMPLEX
-        font_scale = 0.6
-        thickness = 2
-        
-        (text_width, text_height), baseline = cv2.getTextSize(
-            label, font, font_scale, thickness
-        )
-        
-        # Rectángulo de fondo
-        cv2.rectangle(
-            image,
-            (x1, y1 - text_height - 10),
-            (x1 + text_width + 10, y1),
-            color,
-            -1
-        )
-        
-        # Texto
-        cv2.putText(
-            image,
-            label,
-            (x1 + 5, y1 - 5),
-            font,
-            font_scale,
-            (255, 255, 255),
-            thickness,
-            cv2.LINE_AA
-        )
+        # Fondo y texto precalculados para la etiqueta
+        _draw_label(image, label, x1, y1, color)
 
 
 def draw_faces_simple(image, detections):
@@ -515,16 +1004,14 @@ def draw_faces_simple(image, detections):
         image: Imagen donde dibujar
         detections: Lista de detecciones
     """
-    for det in detections:
-        x, y, w, h = det['bbox']
-        
-        x1 = int(x - w/2)
-        y1 = int(y - h/2)
-        x2 = int(x + w/2)
-        y2 = int(y + h/2)
-        
+    if not detections:
+        return
+    
+    boxes_xyxy = _bboxes_to_xyxy([det['bbox'] for det in detections])
+    
+    for det, (x1, y1, x2, y2) in zip(detections, boxes_xyxy):
         is_unknown = det.get('is_unknown', True)
-        color = (0, 165, 255) if is_unknown else (0, 255, 0)
+        color = COLOR_UNKNOWN if is_unknown else COLOR_KNOWN
         
         cv2.rectangle(image, (x1, y1), (x2, y2), color, 2)
         
@@ -536,29 +1023,4 @@ def draw_faces_simple(image, detections):
         else:
             label = f"{person_name} ({similarity:.0f}%)"
         
-        font = cv2.FONT_HERSHEY_SIMPLEX
-        font_scale = 0.6
-        thickness = 2
-        
-        (text_width, text_height), baseline = cv2.getTextSize(
-            label, font, font_scale, thickness
-        )
-        
-        cv2.rectangle(
-            image,
-            (x1, y1 - text_height - 10),
-            (x1 + text_width + 10, y1),
-            color,
-            -1
-        )
-        
-        cv2.putText(
-            image,
-            label,
-            (x1 + 5, y1 - 5),
-            font,
-            font_scale,
-            (255, 255, 255),
-            thickness,
-            cv2.LINE_AA
-        )
+        _draw_label(image, label, x1, y1, color)
@@ -0,0 +1,130 @@
+"""
+Kernels compilados con Numba para las utilidades de reconocimiento facial
+Si numba no está instalado, NUMBA_AVAILABLE es False y face_utils/face_database usan NumPy
+"""
+
+import numpy as np
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+# A partir de este número de tracks conviene repartir las filas entre hilos
+PARALLEL_MIN_ROWS = 32
+
+
+if NUMBA_AVAILABLE:
+    def _pairwise_iou_kernel(tracks, dets):
+        """
+        Matriz de IoU (M, N) entre dos arrays float64 (M, 4) y (N, 4) en formato xywh
+        
+        Evita las matrices temporales del broadcasting de NumPy, que dominan
+        el costo con pocas caras por frame.
+        """
+        m = tracks.shape[0]
+        n = dets.shape[0]
+        iou = np.zeros((m, n))
+        
+        for i in prange(m):
+            t_x1 = tracks[i, 0] - tracks[i, 2] / 2
+            t_y1 = tracks[i, 1] - tracks[i, 3] / 2
+            t_x2 = tracks[i, 0] + tracks[i, 2] / 2
+            t_y2 = tracks[i, 1] + tracks[i, 3] / 2
+            area_t = tracks[i, 2] * tracks[i, 3]
+            
+            for j in range(n):
+                d_x1 = dets[j, 0] - dets[j, 2] / 2
+                d_y1 = dets[j, 1] - dets[j, 3] / 2
+                d_x2 = dets[j, 0] + dets[j, 2] / 2
+                d_y2 = dets[j, 1] + dets[j, 3] / 2
+                
+                inter_ancho = min(t_x2, d_x2) - max(t_x1, d_x1)
+                inter_alto = min(t_y2, d_y2) - max(t_y1, d_y1)
+                if inter_ancho <= 0 or inter_alto <= 0:
+                    continue
+                
+                inter_area = inter_ancho * inter_alto
+                union_area = area_t + dets[j, 2] * dets[j, 3] - inter_area
+                if union_area > 0:
+                    iou[i, j] = inter_area / union_area
+        
+        return iou
+    
+    # La misma función compilada secuencial (pocas caras) y con filas en paralelo;
+    # nogil permite llamarlas desde hilos de trabajo sin bloquear al resto
+    _pairwise_iou_serial = njit(cache=True, fastmath=True, nogil=True)(_pairwise_iou_kernel)
+    _pairwise_iou_parallel = njit(cache=True, fastmath=True, nogil=True, parallel=True)(_pairwise_iou_kernel)
+    
+    def pairwise_iou_xywh_numba(tracks, dets):
+        """Despacha al kernel paralelo solo cuando hay suficientes tracks"""
+        if tracks.shape[0] >= PARALLEL_MIN_ROWS:
+            return _pairwise_iou_parallel(tracks, dets)
+        return _pairwise_iou_serial(tracks, dets)
+    
+    @njit(cache=True, nogil=True)
+    def _popcount64(x):
+        """Bits en 1 de un uint64 (suma SWAR, sin tabla)"""
+        x = x - ((x >> np.uint64(1)) & np.uint64(0x5555555555555555))
+        x = (x & np.uint64(0x3333333333333333)) + ((x >> np.uint64(2)) & np.uint64(0x3333333333333333))
+        x = (x + (x >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+        return np.int64((x * np.uint64(0x0101010101010101)) >> np.uint64(56))
+    
+    @njit(cache=True, nogil=True)
+    def hamming_best_match_numba(queries, words, n):
+        """
+        Persona más cercana (Hamming) para cada consulta, entre normal y volteado
+        
+        Recorre los hashes palabra a palabra sin materializar el XOR
+        (consultas, 2 * personas, palabras) ni la tabla de conteo por byte.
+        
+        Args:
+            queries: Array uint64 (Q, W) con los hashes a buscar
+            words: Array uint64 (2 * n, W): n normales seguidos de n volteados
+            n: Número de personas
+            
+        Returns:
+            (filas, distancias): arrays int64 (Q,) con la primera persona de
+            distancia mínima y esa distancia (igual que np.argmin)
+        """
+        q = queries.shape[0]
+        w = queries.shape[1]
+        best_rows = np.zeros(q, dtype=np.int64)
+        best_distances = np.zeros(q, dtype=np.int64)
+        
+        for i in range(q):
+            best = np.int64(w * 64 + 1)
+            best_row = 0
+            for j in range(n):
+                dist_normal = 0
+                dist_flipped = 0
+                for k in range(w):
+                    dist_normal += _popcount64(queries[i, k] ^ words[j, k])
+                    dist_flipped += _popcount64(queries[i, k] ^ words[j + n, k])
+                dist = min(dist_normal, dist_flipped)
+                if dist < best:
+                    best = dist
+                    best_row = j
+            best_rows[i] = best_row
+            best_distances[i] = best
+        
+        return best_rows, best_distances
+
+
+def warmup():
+    """
+    Compila (o carga desde la caché en disco) los kernels antes del primer frame
+    
+    Con cache=True la compilación solo ocurre la primera vez; las siguientes
+    ejecuciones cargan el código máquina guardado junto al módulo.
+    """
+    if not NUMBA_AVAILABLE:
+        return
+    boxes = np.zeros((1, 4))
+    _pairwise_iou_serial(boxes, boxes)
+    _pairwise_iou_parallel(boxes, boxes)
+    # Las consultas llegan como vistas de solo lectura (np.frombuffer)
+    queries = np.frombuffer(bytes(8), dtype=np.uint64).reshape(1, 1)
+    hamming_best_match_numba(queries, np.zeros((2, 1), dtype=np.uint64), 1)
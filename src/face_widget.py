@@ -1,3 +1,5 @@
+import os
+from collections import OrderedDict
 from PyQt6.QtWidgets import QFrame, QVBoxLayout, QLabel, QHBoxLayout
 from PyQt6.QtGui import QPixmap, QImage
 from PyQt6.QtCore import Qt
@@ -5,10 +7,136 @@ import cv2
 import numpy as np
 
 
+# Lado de la miniatura mostrada en cada widget
+THUMB_SIZE = 160
+
+
+# Hojas de estilo por tipo de persona {is_unknown: stylesheet}, armadas una sola vez
+_STYLE_COLORS = {
+    True: "#ffa500",   # Naranja para desconocidos
+    False: "#00ff00"   # Verde para conocidos
+}
+
+_NAME_STYLESHEETS = {
+    is_unknown: f"font-weight: 700; color: {color}; font-size: 11pt;"
+    for is_unknown, color in _STYLE_COLORS.items()
+}
+
+_FRAME_STYLESHEETS = {
+    is_unknown: f"""
+    QFrame#facePreview {{
+        background-color: #0f1116;
+        border: 2px solid {color};
+        border-radius: 10px;
+        padding: 5px;
+    }}
+"""
+    for is_unknown, color in _STYLE_COLORS.items()
+}
+
+
+# Miniaturas de la BD ya decodificadas: {ruta: (mtime, QPixmap)} en orden LRU
+_pixmap_cache = OrderedDict()
+_PIXMAP_CACHE_MAX = 256
+
+
+def _decode_db_pixmap(path):
+    """Decodifica y escala una imagen de la BD al tamaño de la miniatura"""
+    pix = QPixmap(path)
+    if pix.isNull():
+        return pix
+    return pix.scaled(
+        THUMB_SIZE,
+        THUMB_SIZE,
+        Qt.AspectRatioMode.KeepAspectRatio,
+        Qt.TransformationMode.SmoothTransformation
+    )
+
+
+def _load_db_pixmap(path):
+    """
+    Miniatura de una imagen de la BD (QPixmap nulo si no existe)
+    
+    Se decodifica una sola vez por archivo. La fecha de modificación se guarda
+    junto a la miniatura: si la imagen de una persona se re-registra en disco,
+    la siguiente consulta la vuelve a cargar y reemplaza la entrada anterior.
+    """
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return QPixmap()
+    
+    cached = _pixmap_cache.get(path)
+    if cached is not None and cached[0] == mtime:
+        _pixmap_cache.move_to_end(path)
+        return cached[1]
+    
+    pix = _decode_db_pixmap(path)
+    if pix.isNull():
+        # Puede ser un archivo que aún se está escribiendo: no se guarda
+        return pix
+    
+    _pixmap_cache[path] = (mtime, pix)
+    _pixmap_cache.move_to_end(path)
+    if len(_pixmap_cache) > _PIXMAP_CACHE_MAX:
+        _pixmap_cache.popitem(last=False)
+    return pix
+
+
+def face_thumbnail(face_img, size=THUMB_SIZE):
+    """
+    Miniatura de una cara capturada (numpy BGR)
+    
+    Las caras más grandes que la miniatura se reducen con cv2.resize antes de
+    pasar a Qt, así solo se copia a Qt el tamaño final.
+    
+    Args:
+        face_img: numpy array en formato BGR
+        size: Lado máximo de la miniatura en px
+        
+    Returns:
+        QPixmap (nulo si face_img no es un numpy array)
+    """
+    if not isinstance(face_img, np.ndarray):
+        return QPixmap()
+    
+    h, w = face_img.shape[:2]
+    scale = size / max(h, w)
+    if scale < 1:
+        dsize = (max(1, round(w * scale)), max(1, round(h * scale)))
+        face_img = cv2.resize(face_img, dsize, interpolation=cv2.INTER_AREA)
+    
+    # Qt lee BGR directamente; fromImage copia los datos antes de soltar el buffer
+    face_img = np.ascontiguousarray(face_img)
+    h, w = face_img.shape[:2]
+    q_img = QImage(face_img.data, w, h, face_img.strides[0], QImage.Format.Format_BGR888)
+    pixmap = QPixmap.fromImage(q_img)
+    
+    if scale > 1:
+        # Caras pequeñas: ampliar manteniendo proporción
+        pixmap = pixmap.scaled(
+            size,
+            size,
+            Qt.AspectRatioMode.KeepAspectRatio,
+            Qt.TransformationMode.SmoothTransformation
+        )
+    return pixmap
+
+
 class FaceWidget(QFrame):
     """Widget para mostrar una cara detectada con su información"""
     
-    def __init__(self, person_name="Desconocido", similarity=0.0, face_img=None, db_img_path=None, is_unknown=True):
+    def __init__(self, person_name="Desconocido", similarity=0.0, face_img=None, db_img_path=None, is_unknown=True,
+                 face_pixmap=None):
+        """
+        Args:
+            person_name: Nombre mostrado
+            similarity: Porcentaje de coincidencia con la BD
+            face_img: Cara capturada (numpy BGR)
+            db_img_path: Imagen registrada en la BD (se prioriza para conocidos)
+            is_unknown: Si la persona no está registrada
+            face_pixmap: Miniatura ya generada de face_img (evita volver a escalarla)
+        """
         super().__init__()
         self.setObjectName("facePreview")
         self.setMinimumWidth(180)
@@ -18,63 +146,61 @@ class FaceWidget(QFrame):
         layout.setContentsMargins(10, 10, 10, 10)
 
         # Imagen de la cara
-        img_lbl = QLabel()
-        img_lbl.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        img_lbl.setFixedSize(160, 160)
-        img_lbl.setStyleSheet("background-color: #1a1d23; border-radius: 8px;")
+        self.img_lbl = QLabel()
+        self.img_lbl.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.img_lbl.setFixedSize(THUMB_SIZE, THUMB_SIZE)
+        self.img_lbl.setStyleSheet("background-color: #1a1d23; border-radius: 8px;")
+        layout.addWidget(self.img_lbl, 0, Qt.AlignmentFlag.AlignHCenter)
+
+        # Nombre y porcentaje de coincidencia
+        self.name_lbl = QLabel()
+        self.name_lbl.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.name_lbl.setWordWrap(True)
+        layout.addWidget(self.name_lbl)
+        
+        self.update_data(person_name, similarity, face_img, db_img_path, is_unknown, face_pixmap)
+    
+    def update_data(self, person_name="Desconocido", similarity=0.0, face_img=None, db_img_path=None,
+                    is_unknown=True, face_pixmap=None):
+        """
+        Reemplaza la persona mostrada (permite reutilizar el widget)
+        
+        Args:
+            Los mismos que el constructor
+        """
+        self.img_lbl.clear()
         
         # Priorizar imagen de la base de datos si existe
         if db_img_path and not is_unknown:
             try:
-                pix = QPixmap(db_img_path)
+                pix = _load_db_pixmap(db_img_path)
                 if not pix.isNull():
-                    pix = pix.scaled(
-                        img_lbl.width(), 
-                        img_lbl.height(), 
-                        Qt.AspectRatioMode.KeepAspectRatio, 
-                        Qt.TransformationMode.SmoothTransformation
-                    )
-                    img_lbl.setPixmap(pix)
+                    self.img_lbl.setPixmap(pix)
             except:
                 # Si falla, usar la imagen capturada
-                if face_img is not None:
-                    pix = self._convert_face_to_pixmap(face_img)
-                    img_lbl.setPixmap(pix)
+                if face_pixmap is not None or face_img is not None:
+                    if face_pixmap is None:
+                        face_pixmap = self._convert_face_to_pixmap(face_img)
+                    self.img_lbl.setPixmap(face_pixmap)
+        elif face_pixmap is not None:
+            # Miniatura ya generada
+            self.img_lbl.setPixmap(face_pixmap)
         elif face_img is not None:
             # Usar imagen capturada
             pix = self._convert_face_to_pixmap(face_img)
-            img_lbl.setPixmap(pix)
-        
-        layout.addWidget(img_lbl, 0, Qt.AlignmentFlag.AlignHCenter)
+            self.img_lbl.setPixmap(pix)
 
         # Nombre y porcentaje de coincidencia
         if is_unknown:
             name_text = f"{person_name}"
-            color = "#ffa500"  # Naranja para desconocidos
         else:
             name_text = f"{person_name}\nCoincidencia: {similarity:.1f}%"
-            color = "#00ff00"  # Verde para conocidos
         
-        name = QLabel(name_text)
-        name.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        name.setStyleSheet(f"font-weight: 700; color: {color}; font-size: 11pt;")
-        name.setWordWrap(True)
-        layout.addWidget(name)
+        self.name_lbl.setText(name_text)
+        self.name_lbl.setStyleSheet(_NAME_STYLESHEETS[bool(is_unknown)])
         
         # Estilo del frame
-        if is_unknown:
-            border_color = "#ffa500"
-        else:
-            border_color = "#00ff00"
-        
-        self.setStyleSheet(f"""
-            QFrame#facePreview {{
-                background-color: #0f1116;
-                border: 2px solid {border_color};
-                border-radius: 10px;
-                padding: 5px;
-            }}
-        """)
+        self.setStyleSheet(_FRAME_STYLESHEETS[bool(is_unknown)])
     
     def _convert_face_to_pixmap(self, face_img):
         """
@@ -86,31 +212,4 @@ class FaceWidget(QFrame):
         Returns:
             QPixmap
         """
-        if isinstance(face_img, np.ndarray):
-            # Convertir BGR a RGB
-            rgb_img = cv2.cvtColor(face_img, cv2.COLOR_BGR2RGB)
-            
-            h, w, ch = rgb_img.shape
-            bytes_per_line = ch * w
-            
-            q_img = QImage(
-                rgb_img.data,
-                w,
-                h,
-                bytes_per_line,
-                QImage.Format.Format_RGB888
-            )
-            
-            pixmap = QPixmap.fromImage(q_img)
-            
-            # Escalar manteniendo proporción
-            pixmap = pixmap.scaled(
-                160, 
-                160, 
-                Qt.AspectRatioMode.KeepAspectRatio, 
-                Qt.TransformationMode.SmoothTransformation
-            )
-            
-            return pixmap
-        
-        return QPixmap()
+        return face_thumbnail(face_img)
@@ -3,6 +3,7 @@ Script para inicializar la base de datos de reconocimiento facial
 Permite registrar personas manualmente desde imágenes
 """
 
+import argparse
 import cv2
 import os
 from face_database import FaceDatabase
@@ -35,8 +36,20 @@ def register_person_from_image(db, image_path, person_name):
         return False
 
 
-def main():
+def parse_args(argv=None):
+    """Argumentos de línea de comandos (sin argumentos se comporta como antes)"""
+    parser = argparse.ArgumentParser(description="Inicializa la base de datos de reconocimiento facial")
+    parser.add_argument('--faces-dir', default="data/training_faces",
+                        help="Directorio con imágenes nombradas como la persona (default: data/training_faces)")
+    parser.add_argument('--no-interactive', action='store_true',
+                        help="Omitir el registro manual (no espera entrada del usuario)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
     """Función principal"""
+    args = parse_args(argv)
+    
     print("=" * 60)
     print("   INICIALIZACIÓN DE BASE DE DATOS - RECONOCIMIENTO FACIAL")
     print("=" * 60)
@@ -55,7 +68,7 @@ def main():
     print("OPCIÓN 1: Registrar personas desde un directorio")
     print("-" * 60)
     
-    faces_dir = "data/training_faces"
+    faces_dir = args.faces_dir
     
     if os.path.exists(faces_dir):
         print(f"Buscando imágenes en: {faces_dir}")
@@ -74,12 +87,25 @@ def main():
             print(f"Se encontraron {len(images)} imágenes")
             print()
             
+            items = []
             for img_file in images:
                 # Usar el nombre del archivo (sin extensión) como nombre de la persona
                 person_name = os.path.splitext(img_file)[0].replace('_', ' ').title()
                 img_path = os.path.join(faces_dir, img_file)
                 
-                register_person_from_image(db, img_path, person_name)
+                img = cv2.imread(img_path)
+                if img is None:
+                    print(f" Error: No se pudo leer la imagen {img_path}")
+                    continue
+                items.append((person_name, img))
+            
+            # Registrar todas en una sola transacción
+            registered = set(db.register_persons_bulk(items, hash_size=16))
+            for person_name, _ in items:
+                if person_name in registered:
+                    print(f"✅ {person_name} registrado exitosamente")
+                else:
+                    print(f"⚠️  {person_name} ya está registrado")
         else:
             print("  No se encontraron imágenes en el directorio")
     else:
@@ -95,7 +121,7 @@ def main():
     print("OPCIÓN 2: Registrar personas manualmente")
     print("-" * 60)
     
-    while True:
+    while not args.no_interactive:
         print()
         resp = input("¿Deseas registrar una persona manualmente? (s/n): ").strip().lower()
         
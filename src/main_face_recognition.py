@@ -1,5 +1,7 @@
 import os
 import sys
+import time
+from collections import deque
 from PyQt6.QtWidgets import (
     QMainWindow, QWidget, QHBoxLayout, QVBoxLayout,
     QLabel, QFrame, QToolButton, QGridLayout, 
@@ -7,18 +9,191 @@ from PyQt6.QtWidgets import (
     QDialog, QDialogButtonBox
 )
 from PyQt6.QtGui import QIcon, QPixmap, QImage
-from PyQt6.QtCore import Qt, QSize, QTimer
-import cv2
+from PyQt6.QtCore import Qt, QSize, QTimer, QThread, pyqtSignal
 import numpy as np
 
-from face_widget import FaceWidget
+from face_widget import FaceWidget, face_thumbnail
 from video_frame import VideoFrame
-from face_scanner import LiveFaceScanner
+from camera_workers import CaptureThread, InferenceThread, open_camera, pin_inference_thread
 from dialogs import SelectFaceDialog
 
 BASE = os.path.dirname(__file__)
 ASSETS = os.path.join(BASE, "assets")
 
+# Periodo de refresco del panel de detecciones (4 Hz, independiente de los FPS)
+PANEL_REFRESH_MS = 250
+
+# face_scanner arrastra torch/ultralytics (varios segundos): se importa, y el
+# scanner se crea, en segundo plano mientras la ventana ya se muestra
+LiveFaceScanner = None
+
+
+def _preload_torch_dlls():
+    """
+    En Windows, carga una a una las DLL de torch\\lib
+    
+    Un "import torch" que falla con OSError suele deberse al orden de carga de
+    dependencias (torch_cuda.dll, caffe2_nvrtc.dll...). Cargarlas explícitamente
+    resuelve ese caso y, si alguna no carga, permite decir cuál.
+    
+    Returns:
+        Lista de "dll: error" de las que no se pudieron cargar
+    """
+    if sys.platform != 'win32':
+        return []
+    import ctypes
+    import glob
+    import importlib.util
+    
+    try:
+        spec = importlib.util.find_spec('torch')
+    except (ImportError, ValueError):
+        spec = None
+    if spec is None or not spec.submodule_search_locations:
+        return []
+    torch_lib = os.path.join(list(spec.submodule_search_locations)[0], 'lib')
+    if not os.path.isdir(torch_lib):
+        return []
+    
+    # Las DLL de torch\\lib dependen unas de otras
+    os.add_dll_directory(torch_lib)
+    failed = []
+    for dll_path in sorted(glob.glob(os.path.join(torch_lib, '*.dll'))):
+        try:
+            ctypes.WinDLL(dll_path)
+        except OSError as e:
+            failed.append(f"{os.path.basename(dll_path)}: {e}")
+    return failed
+
+
+class ScannerLoadThread(QThread):
+    """Importa face_scanner y crea el LiveFaceScanner fuera del hilo de la GUI"""
+
+    ready = pyqtSignal(object)  # LiveFaceScanner listo para usar
+    failed = pyqtSignal(str)
+
+    def __init__(self, settings, parent=None):
+        """
+        Args:
+            settings: Argumentos de LiveFaceScanner
+            parent: QObject padre
+        """
+        super().__init__(parent)
+        self.settings = settings
+
+    def run(self):
+        global LiveFaceScanner
+        # Antes de importar torch: el pool de hilos que se cree en el warmup
+        # hereda la afinidad y no compite con el núcleo de captura
+        pin_inference_thread()
+        try:
+            import face_scanner
+        except ImportError as e:
+            self.failed.emit(f"No se pudieron cargar las dependencias del modelo:\n{e}")
+            return
+        except OSError as e:
+            # DLL de torch/CUDA que no carga: precargarlas y reintentar una vez
+            failed_dlls = _preload_torch_dlls()
+            try:
+                import face_scanner
+            except (ImportError, OSError):
+                details = "\n".join(failed_dlls)
+                self.failed.emit(
+                    f"No se pudieron cargar las dependencias del modelo:\n{e}"
+                    + (f"\n\nDLL que no cargan:\n{details}" if details else "")
+                )
+                return
+        LiveFaceScanner = face_scanner.LiveFaceScanner
+        
+        try:
+            import torch
+            if torch.cuda.is_available():
+                # Se mide aparte: la primera vez CUDA compila los kernels a la caché
+                # de NVIDIA (ComputeCache) y esto puede llevar más de 10 s
+                start = time.perf_counter()
+                torch.cuda.init()
+                torch.empty(1, device='cuda')
+                torch.cuda.synchronize()
+                print(f"Contexto CUDA inicializado en {time.perf_counter() - start:.2f}s")
+            
+            print("Cargando modelo YOLO...")
+            scanner = LiveFaceScanner(**self.settings)
+            
+            # Un frame vacío inicializa cuDNN y el modelo antes del primer frame real
+            start = time.perf_counter()
+            size = self.settings['size']
+            scanner.process_frame(np.zeros((size, size, 3), dtype=np.uint8))
+            scanner.reset_tracker()
+            print(f"Scanner creado (primer frame: {time.perf_counter() - start:.2f}s)")
+        except (Exception, SystemExit) as e:
+            # El detector llama a sys.exit() si no encuentra los pesos
+            self.failed.emit(
+                f"Error al cargar el modelo:\n{str(e)}\n\n"
+                f"Asegúrate de tener el modelo YOLO en:\n{self.settings['path_weights']}"
+            )
+            return
+        self.ready.emit(scanner)
+
+
+# Hojas de estilo compartidas por todas las instancias
+_SCROLL_STYLESHEET = """
+    QScrollArea {
+        border: none;
+        background-color: transparent;
+    }
+"""
+
+_MAIN_STYLESHEET = """
+    QMainWindow {
+        background-color: #0b0d11;
+    }
+
+    QFrame#leftSection, QFrame#rightSection {
+        background-color: #0f1116;
+        border-radius: 12px;
+        border: 1px solid rgba(255,255,255,0.08);
+    }
+
+    QPushButton {
+        background-color: #5865f2;
+        color: white;
+        border: none;
+        border-radius: 8px;
+        padding: 10px 20px;
+        font-size: 11pt;
+        font-weight: bold;
+    }
+
+    QPushButton:hover {
+        background-color: #4752c4;
+    }
+
+    QPushButton:pressed {
+        background-color: #3c45a5;
+    }
+
+    QPushButton#registerButton {
+        background-color: #43b581;
+    }
+
+    QPushButton#registerButton:hover {
+        background-color: #3ca374;
+    }
+
+    QPushButton#clearButton {
+        background-color: #ed4245;
+    }
+
+    QPushButton#clearButton:hover {
+        background-color: #c03537;
+    }
+
+    QPushButton:disabled {
+        background-color: #2c2f33;
+        color: #666;
+    }
+"""
+
 
 class FaceRecognitionWindow(QMainWindow):
     """Ventana principal para reconocimiento facial"""
@@ -34,16 +209,41 @@ class FaceRecognitionWindow(QMainWindow):
             "confidence": 0.6,
             "iou": 0.5,
             "hash_size": 16,
-            "db_path": "data/faces.db"
+            "db_path": "data/faces.db",
+            "sqlite_pragmas": {
+                "journal_mode": "WAL",
+                "synchronous": "NORMAL",
+                "mmap_size": 268435456,
+                "cache_size": -65536,
+                "temp_store": "MEMORY",
+                "busy_timeout": 60000
+            },
+            # use_tensorrt: reutiliza (o exporta una vez) el .engine junto a los pesos;
+            # half=None activa FP16 automáticamente cuando hay CUDA
+            "detector_options": {
+                "use_tensorrt": False,
+                "precision": "fp16",
+                "half": None
+            }
         }
         
         # Estados
-        self.webcam_timer = None
-        self.webcam_capture = None
+        self.capture_thread = None
+        self.inference_thread = None
         self.is_running = False
         
         # Personas detectadas (sin duplicados)
         self.detected_persons = {}  # {person_name: face_data}
+        self._last_seen_version = 0  # Versión del scanner ya reflejada en el panel
+        self._unknown_names = {}  # Desconocidos en detected_persons (dict como set ordenado)
+        self._widget_pool = []  # FaceWidgets ocultos tras limpiar el panel, para reutilizar
+        
+        # El panel se refresca cada PANEL_REFRESH_MS, no por cada frame de inferencia
+        self._pending_persons = deque()
+        self._panel_dirty = False
+        self._panel_timer = QTimer(self)
+        self._panel_timer.setInterval(PANEL_REFRESH_MS)
+        self._panel_timer.timeout.connect(self._flush_panel)
         
         self.setWindowTitle("Sistema de Reconocimiento Facial")
         self.setMinimumSize(1320, 720)
@@ -146,12 +346,7 @@ class FaceRecognitionWindow(QMainWindow):
         scroll = QScrollArea()
         scroll.setWidgetResizable(True)
         scroll.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
-        scroll.setStyleSheet("""
-            QScrollArea {
-                border: none;
-                background-color: transparent;
-            }
-        """)
+        scroll.setStyleSheet(_SCROLL_STYLESHEET)
         
         scroll_content = QWidget()
         self.grid_layout = QGridLayout(scroll_content)
@@ -167,59 +362,30 @@ class FaceRecognitionWindow(QMainWindow):
         
         # Aplicar estilos
         self.apply_styles()
+        
+        # La cámara se habilita cuando termina de cargarse el scanner
+        self.btn_start.setEnabled(False)
+        self.btn_start.setText("Cargando...")
+        self._load_thread = ScannerLoadThread(self.settings, self)
+        self._load_thread.ready.connect(self._on_scanner_loaded)
+        self._load_thread.failed.connect(self._on_scanner_load_failed)
+        self._load_thread.start()
+    
+    def _on_scanner_loaded(self, scanner):
+        """El scanner ya está creado y con el modelo inicializado"""
+        self.scanner = scanner
+        self.btn_start.setText("▶ Iniciar Cámara")
+        self.btn_start.setEnabled(True)
+    
+    def _on_scanner_load_failed(self, message):
+        """Muestra el error de carga; start_camera volverá a intentarlo"""
+        self.btn_start.setText("▶ Iniciar Cámara")
+        self.btn_start.setEnabled(True)
+        QMessageBox.critical(self, "Error", message)
     
     def apply_styles(self):
         """Aplica los estilos CSS a la ventana"""
-        self.setStyleSheet("""
-            QMainWindow {
-                background-color: #0b0d11;
-            }
-            
-            QFrame#leftSection, QFrame#rightSection {
-                background-color: #0f1116;
-                border-radius: 12px;
-                border: 1px solid rgba(255,255,255,0.08);
-            }
-            
-            QPushButton {
-                background-color: #5865f2;
-                color: white;
-                border: none;
-                border-radius: 8px;
-                padding: 10px 20px;
-                font-size: 11pt;
-                font-weight: bold;
-            }
-            
-            QPushButton:hover {
-                background-color: #4752c4;
-            }
-            
-            QPushButton:pressed {
-                background-color: #3c45a5;
-            }
-            
-            QPushButton#registerButton {
-                background-color: #43b581;
-            }
-            
-            QPushButton#registerButton:hover {
-                background-color: #3ca374;
-            }
-            
-            QPushButton#clearButton {
-                background-color: #ed4245;
-            }
-            
-            QPushButton#clearButton:hover {
-                background-color: #c03537;
-            }
-            
-            QPushButton:disabled {
-                background-color: #2c2f33;
-                color: #666;
-            }
-        """)
+        self.setStyleSheet(_MAIN_STYLESHEET)
     
     def toggle_camera(self):
         """Inicia o detiene la cámara"""
@@ -230,10 +396,16 @@ class FaceRecognitionWindow(QMainWindow):
     
     def start_camera(self):
         """Inicia la cámara y el reconocimiento"""
-        # Ya NO importamos aquí, LiveFaceScanner ya está importado al inicio
+        # Normalmente ScannerLoadThread ya creó el scanner al abrir la ventana
+        if LiveFaceScanner is None:
+            QMessageBox.critical(self, "Error", "No se pudieron cargar las dependencias del modelo")
+            return
         
-        # Crear scanner si no existe
-        if not isinstance(self.scanner, LiveFaceScanner):
+        # Crear scanner si no existe (se reutiliza entre inicios de la cámara
+        # para no recargar los pesos)
+        if not isinstance(self.scanner, LiveFaceScanner) or self.scanner.detector is None:
+            if self.scanner is not None:
+                self.scanner.db.close()
             try:
                 print("Cargando modelo YOLO...")
                 self.scanner = LiveFaceScanner(**self.settings)
@@ -248,18 +420,23 @@ class FaceRecognitionWindow(QMainWindow):
                 return
         else:
             self.scanner.reset_tracker()
+        self._last_seen_version = 0
         
         # Abrir webcam
-        self.webcam_capture = cv2.VideoCapture(0)
+        webcam_capture = open_camera(0)
         
-        if not self.webcam_capture.isOpened():
+        if not webcam_capture.isOpened():
             QMessageBox.critical(self, "Error", "No se pudo abrir la cámara")
             return
         
-        # Iniciar timer para actualizar frames
-        self.webcam_timer = QTimer()
-        self.webcam_timer.timeout.connect(self.update_frame)
-        self.webcam_timer.start(33)  # ~30 FPS
+        # Captura e inferencia corren en hilos propios; la GUI solo recibe
+        # el frame ya procesado a través de la señal
+        self.inference_thread = InferenceThread(self.scanner, display=self.video_widget)
+        self.inference_thread.processed.connect(self.on_frame_processed)
+        self.capture_thread = CaptureThread(webcam_capture, self.inference_thread)
+        self.inference_thread.start()
+        self.capture_thread.start()
+        self._panel_timer.start()
         
         self.is_running = True
         self.btn_start.setText("⏸ Detener Cámara")
@@ -268,13 +445,18 @@ class FaceRecognitionWindow(QMainWindow):
     
     def stop_camera(self):
         """Detiene la cámara"""
-        if self.webcam_timer:
-            self.webcam_timer.stop()
-            self.webcam_timer = None
+        self._panel_timer.stop()
+        self._flush_panel()  # No perder lo encolado desde el último tick
+        
+        # Primero la captura (libera la cámara), luego la inferencia
+        if self.capture_thread:
+            self.capture_thread.stop()
+            self.capture_thread = None
         
-        if self.webcam_capture:
-            self.webcam_capture.release()
-            self.webcam_capture = None
+        if self.inference_thread:
+            self.inference_thread.stop()
+            self.inference_thread.processed.disconnect(self.on_frame_processed)
+            self.inference_thread = None
         
         self.is_running = False
         self.btn_start.setText("▶ Iniciar Cámara")
@@ -282,66 +464,76 @@ class FaceRecognitionWindow(QMainWindow):
         self.video_widget.clear_image()
         print("⏹ Cámara detenida")
     
-    def update_frame(self):
-        """Actualiza el frame de la webcam y procesa detecciones"""
-        if not self.webcam_capture:
+    def on_frame_processed(self, processed_frame):
+        """Recibe un frame procesado por el hilo de inferencia"""
+        if not self.is_running:
             return
         
-        ret, frame = self.webcam_capture.read()
-        
-        if not ret:
-            return
+        # Mostrar frame procesado
+        self.video_widget.set_image(processed_frame)
         
-        # Procesar frame con el scanner
-        if self.scanner:
-            processed_frame = self.scanner.process_frame(frame)
-            
-            # Mostrar frame procesado
-            self.video_widget.set_image(processed_frame)
-            
-            # Actualizar detecciones
-            self.update_detections()
+        # Actualizar detecciones
+        self.update_detections()
     
     def update_detections(self):
-        """Actualiza el panel de detecciones con nuevas caras"""
+        """Encola las personas nuevas o actualizadas desde la última consulta"""
         if not self.scanner:
             return
         
-        # Obtener personas detectadas
-        persons = self.scanner.get_detected_persons()
-        
-        # Verificar si hay nuevas personas
-        for person_data in persons:
-            person_name = person_data['name']
-            is_unknown = person_data.get('is_unknown', False)
-            
-            # Para personas conocidas, usar el nombre como key
-            # Para desconocidos, usar el nombre único (ej: "Desconocido #1")
-            person_key = person_name
-            
-            if person_key not in self.detected_persons:
+        changes, self._last_seen_version = self.scanner.get_new_persons_since(self._last_seen_version)
+        if changes:
+            self._pending_persons.extend(changes)
+            self._panel_dirty = True
+    
+    def _flush_panel(self):
+        """Aplica al panel de detecciones los cambios encolados"""
+        if not self._panel_dirty:
+            return
+        self._panel_dirty = False
+        
+        count_before = len(self.detected_persons)
+        while self._pending_persons:
+            person_data = self._pending_persons.popleft()
+            # Para personas conocidas la key es el nombre; para desconocidos,
+            # el nombre único (ej: "Desconocido #1")
+            self.detected_persons[person_data['name']] = person_data
+            if person_data.get('is_unknown', False):
+                self._unknown_names[person_data['name']] = None
+            if person_data['is_new']:
                 # Nueva persona detectada
-                self.detected_persons[person_key] = person_data
                 self.add_face_to_grid(person_data)
-            else:
-                # Actualizar si tiene mejor similitud (para desconocidos similares)
-                if is_unknown:
-                    # Actualizar la imagen si es más reciente
-                    self.detected_persons[person_key] = person_data
         
         # Actualizar contador
-        self.detection_counter.setText(f"{len(self.detected_persons)} persona(s) detectada(s)")
+        if len(self.detected_persons) != count_before:
+            self.detection_counter.setText(f"{len(self.detected_persons)} persona(s) detectada(s)")
     
     def add_face_to_grid(self, person_data):
         """Agrega una cara al grid de detecciones"""
-        face_widget = FaceWidget(
+        # La miniatura de la captura se escala una sola vez y queda en person_data
+        # (los conocidos muestran la imagen de la BD, que tiene su propia caché)
+        face_img = person_data.get('face_image')
+        thumb = person_data.get('thumb_qpix')
+        uses_capture = person_data.get('is_unknown', True) or not person_data.get('db_image_path')
+        if thumb is None and face_img is not None and uses_capture:
+            thumb = person_data['thumb_qpix'] = face_thumbnail(face_img)
+        
+        widget_data = dict(
             person_name=person_data['name'],
             similarity=person_data['similarity'],
-            face_img=person_data.get('face_image'),
+            face_img=face_img,
             db_img_path=person_data.get('db_image_path'),
-            is_unknown=person_data.get('is_unknown', True)
+            is_unknown=person_data.get('is_unknown', True),
+            face_pixmap=thumb
         )
         
+        # Reutilizar un widget de una limpieza anterior antes de crear uno nuevo
+        if self._widget_pool:
+            face_widget = self._widget_pool.pop()
+            face_widget.update_data(**widget_data)
+            face_widget.show()
+        else:
+            face_widget = FaceWidget(**widget_data)
+        
         count = self.grid_layout.count()
         row = count // 2  # 2 columnas
         col = count % 2
@@ -350,15 +542,20 @@ class FaceRecognitionWindow(QMainWindow):
     
     def clear_detections(self):
         """Limpia todas las detecciones"""
-        # Limpiar grid
+        # Limpiar grid: los widgets se ocultan y quedan para reutilizarse
         while self.grid_layout.count():
             item = self.grid_layout.takeAt(0)
             widget = item.widget()
             if widget:
-                widget.deleteLater()
+                widget.hide()
+                self._widget_pool.append(widget)
         
         # Resetear diccionario
         self.detected_persons = {}
+        self._unknown_names = {}
+        self._last_seen_version = 0
+        self._pending_persons.clear()
+        self._panel_dirty = False
         
         # Resetear tracker del scanner
         if self.scanner:
@@ -367,15 +564,25 @@ class FaceRecognitionWindow(QMainWindow):
         # Actualizar contador
         self.detection_counter.setText("0 persona(s) detectada(s)")
     
+    def _latest_unknown(self, name):
+        """
+        Datos de un desconocido con su captura más reciente
+        
+        El panel no reescribe a los desconocidos en cada frame; la cara actual
+        se toma del buffer de muestras del scanner solo al abrir el diálogo.
+        """
+        person_data = self.detected_persons[name]
+        samples = self.scanner.get_unknown_samples(name) if self.scanner else []
+        if samples and samples[-1] is not person_data.get('face_image'):
+            person_data = {**person_data, 'face_image': samples[-1]}
+            person_data.pop('thumb_pixmap', None)
+            self.detected_persons[name] = person_data
+        return person_data
+    
     def register_person_dialog(self):
         """Abre diálogo para registrar una persona desconocida"""
         # Buscar si hay alguna persona desconocida
-        unknown_persons = [
-            p for p in self.detected_persons.values() 
-            if p.get('is_unknown', False)
-        ]
-        
-        if not unknown_persons:
+        if not self._unknown_names:
             QMessageBox.information(
                 self,
                 "Info",
@@ -383,6 +590,8 @@ class FaceRecognitionWindow(QMainWindow):
             )
             return
         
+        unknown_persons = [self._latest_unknown(name) for name in self._unknown_names]
+        
         dialog = SelectFaceDialog(unknown_persons, self)
         
         if dialog.exec() == QDialog.DialogCode.Accepted:
@@ -392,9 +601,11 @@ class FaceRecognitionWindow(QMainWindow):
             
             # Registrar en la base de datos
             try:
-                success = self.scanner.register_new_person(person_name, face_image)
+                samples = self.scanner.get_unknown_samples(selected_person['name'])
+                success = self.scanner.register_new_person(person_name, face_image, samples)
                 
                 if success:
+                    self._unknown_names.pop(selected_person['name'], None)
                     QMessageBox.information(
                         self,
                         "Éxito",
@@ -418,11 +629,15 @@ class FaceRecognitionWindow(QMainWindow):
     
     def closeEvent(self, event):
         """Cleanup al cerrar"""
+        # Un QThread no puede destruirse mientras corre
+        self._load_thread.wait()
         self.stop_camera()
         
-        # Cerrar base de datos
-        if self.scanner and hasattr(self.scanner, 'db'):
-            self.scanner.db.close()
+        # Liberar el modelo y cerrar base de datos
+        if self.scanner:
+            self.scanner.release_model()
+            if hasattr(self.scanner, 'db'):
+                self.scanner.db.close()
         
         event.accept()
 
@@ -1,8 +1,24 @@
 from PyQt6.QtWidgets import QLabel
 from PyQt6.QtGui import QPixmap, QImage, QPainter
-from PyQt6.QtCore import Qt, QSize
+from PyQt6.QtCore import Qt, QSize, QRect, QTimer
 import numpy as np
 
+
+# Tras el último resizeEvent se espera este tiempo antes de volver al escalado suave
+RESIZE_SMOOTH_DELAY_MS = 50
+
+# Lado máximo del placeholder centrado cuando no hay imagen
+PLACEHOLDER_SIZE = 120
+
+
+def fit_size(img_w, img_h, box_w, box_h):
+    """
+    Tamaño (w, h) de una imagen escalada para caber en una caja manteniendo aspect ratio
+    """
+    scale = min(box_w / img_w, box_h / img_h)
+    return max(1, int(img_w * scale)), max(1, int(img_h * scale))
+
+
 class VideoFrame(QLabel):
     def __init__(self, placeholder_path=None):
         super().__init__()
@@ -20,99 +36,207 @@ class VideoFrame(QLabel):
 
         self.original_pixmap = None
         self.placeholder_pixmap = None
+        self._placeholder_scaled = None  # Placeholder ya escalado a PLACEHOLDER_SIZE
+        
+        # Frame de video actual: QImage sobre el buffer de numpy (sin copia) que
+        # se escala al pintar; el array se conserva mientras el QImage lo use
+        self._frame_image = None
+        self._frame_buffer = None
+        
+        # Última imagen fija escalada, con su clave (cacheKey del origen, ancho, alto, modo)
+        self._scaled_cache_key = None
+        self._scaled_pixmap = None
+        
+        # Mientras se arrastra el borde de la ventana se escala en modo rápido;
+        # el escalado suave se hace una sola vez cuando el tamaño se estabiliza
+        self._resizing = False
+        self._smooth_timer = QTimer(self)
+        self._smooth_timer.setSingleShot(True)
+        self._smooth_timer.setInterval(RESIZE_SMOOTH_DELAY_MS)
+        self._smooth_timer.timeout.connect(self._finish_resize)
+        
+        # Si se mostró algo distinto del placeholder (lo mantienen set_image/clear_image)
+        self._has_user_content = False
+        
+        # Tamaño del área de dibujo en píxeles físicos; lo leen otros hilos para
+        # entregar frames ya reducidos (atributo Python simple, no se llama a Qt desde fuera)
+        self.display_size = self._physical_size()
 
-        if placeholder_path:
-            pix = QPixmap(placeholder_path)
+        pix = QPixmap(placeholder_path) if placeholder_path else None
+        # Un placeholder que no carga se trata como ausente (una sola comprobación)
+        if pix is not None and not pix.isNull():
             self.placeholder_pixmap = pix
             self.original_pixmap = pix
+            # Salvo en ventanas muy pequeñas el placeholder siempre se muestra a
+            # este tamaño: se escala una sola vez
+            self._placeholder_scaled = self._scaled_to(
+                pix, QSize(PLACEHOLDER_SIZE, PLACEHOLDER_SIZE),
+                Qt.TransformationMode.SmoothTransformation
+            )
 
     def resizeEvent(self, event):
         super().resizeEvent(event)
-        self._update_display()
+        self.display_size = self._physical_size()
+        self._resizing = True
+        self._smooth_timer.start()
+        if self._frame_image is None:
+            self._update_display(Qt.TransformationMode.FastTransformation)
 
-    def _update_display(self):
+    def _finish_resize(self):
+        """Repite con escalado suave el último tamaño de un redimensionado"""
+        self._resizing = False
+        if self._frame_image is None:
+            self._update_display()
+        else:
+            self.update()
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self._frame_image is None:
+            return
+        
+        # Rectángulo centrado (en coordenadas lógicas) que mantiene el aspect ratio
+        # del frame; si llega al tamaño físico de display_size, drawImage copia sin escalar
+        w, h = fit_size(self._frame_image.width(), self._frame_image.height(),
+                        self.width(), self.height())
+        target = QRect((self.width() - w) // 2, (self.height() - h) // 2, w, h)
+        
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform, not self._resizing)
+        painter.drawImage(target, self._frame_image)
+        painter.end()
+
+    def _update_display(self, mode=Qt.TransformationMode.SmoothTransformation):
+        # resizeEvent puede llegar con tamaño 0 al construir el widget
+        if self.width() <= 0 or self.height() <= 0:
+            return
         if self.original_pixmap and not self.original_pixmap.isNull():
             # Calcular el tamaño escalado manteniendo aspect ratio
-            scaled = self.original_pixmap.scaled(
-                self.size(),
-                Qt.AspectRatioMode.KeepAspectRatio,
-                Qt.TransformationMode.SmoothTransformation
-            )
-            super().setPixmap(scaled)
+            super().setPixmap(self._scaled(self.original_pixmap, self.size(), mode))
         elif self.placeholder_pixmap:
             # Para el placeholder, usar un tamaño más pequeño y centrado
             target_size = QSize(
-                min(self.width() - 40, 120),
-                min(self.height() - 40, 120)
-            )
-            scaled = self.placeholder_pixmap.scaled(
-                target_size,
-                Qt.AspectRatioMode.KeepAspectRatio,
-                Qt.TransformationMode.SmoothTransformation
+                min(self.width() - 40, PLACEHOLDER_SIZE),
+                min(self.height() - 40, PLACEHOLDER_SIZE)
             )
-            super().setPixmap(scaled)
+            if target_size.width() <= 0 or target_size.height() <= 0:
+                # Ventana más chica que el margen del placeholder
+                super().clear()
+            elif (target_size == QSize(PLACEHOLDER_SIZE, PLACEHOLDER_SIZE)
+                    and self._placeholder_scaled.devicePixelRatio() == self.devicePixelRatioF()):
+                super().setPixmap(self._placeholder_scaled)
+            else:
+                super().setPixmap(self._scaled(self.placeholder_pixmap, target_size, mode))
+
+    def _scaled(self, pixmap, target_size, mode):
+        """
+        Versión escalada de un pixmap, reutilizando la anterior si ni el pixmap,
+        ni el tamaño, ni el modo de escalado cambiaron
+        """
+        key = (pixmap.cacheKey(), target_size.width(), target_size.height(), mode,
+               self.devicePixelRatioF())
+        if key != self._scaled_cache_key:
+            self._scaled_pixmap = self._scaled_to(pixmap, target_size, mode)
+            self._scaled_cache_key = key
+        return self._scaled_pixmap
+
+    def _scaled_to(self, pixmap, target_size, mode):
+        """
+        Escala un pixmap a un tamaño lógico en píxeles físicos de la pantalla
+        
+        Con HiDPI (devicePixelRatio > 1) el resultado tiene la resolución real
+        de la pantalla y se pinta 1:1, sin que Qt lo vuelva a escalar.
+        """
+        dpr = self.devicePixelRatioF()
+        scaled = pixmap.scaled(
+            round(target_size.width() * dpr),
+            round(target_size.height() * dpr),
+            Qt.AspectRatioMode.KeepAspectRatio,
+            mode
+        )
+        scaled.setDevicePixelRatio(dpr)
+        return scaled
+
+    def _physical_size(self):
+        """(ancho, alto) del widget en píxeles físicos"""
+        dpr = self.devicePixelRatioF()
+        return round(self.width() * dpr), round(self.height() * dpr)
 
     def set_image(self, image):
         """Establece una nueva imagen en el frame"""
+        if isinstance(image, np.ndarray):
+            # Frames de video: se pintan directamente en paintEvent, sin pasar
+            # por QPixmap ni generar una copia escalada por frame
+            if self._frame_image is None:
+                super().clear()
+            self._frame_buffer, self._frame_image = self._ndarray_to_qimage(image)
+            self.original_pixmap = None
+            self._has_user_content = True
+            self.update()
+            return
+        
+        self._frame_image = None
+        self._frame_buffer = None
         if isinstance(image, str):
             pix = QPixmap(image)
         elif isinstance(image, QPixmap):
             pix = image
         elif isinstance(image, QImage):
             pix = QPixmap.fromImage(image)
-        elif isinstance(image, np.ndarray):
-            pix = self._ndarray_to_pixmap(image)
         else:
             raise TypeError(f"Unsupported image type: {type(image)}")
 
         self.original_pixmap = pix
+        self._has_user_content = True
         self._update_display()
 
-    def _ndarray_to_pixmap(self, img: np.ndarray) -> QPixmap:
-        """Convierte numpy/OpenCV image → QPixmap (PyQt6 safe)"""
+    def _ndarray_to_qimage(self, img: np.ndarray):
+        """
+        Envuelve una imagen numpy/OpenCV en un QImage sin copiar los píxeles
+        
+        Returns:
+            (array_contiguo, QImage). El QImage apunta al buffer del array, que
+            debe mantenerse vivo mientras se use.
+        """
+        if img.dtype == np.uint16 and img.ndim == 3:
+            # Color de 16 bits: Qt no tiene BGR de 16 bits, se queda con el byte alto
+            img = (img >> 8).astype(np.uint8)
+        elif img.dtype not in (np.uint8, np.uint16):
+            raise ValueError("Tipo de imagen no soportado")
+        
+        # Qt lee el buffer de numpy directamente (sin tobytes ni conversión de canales)
+        img = np.ascontiguousarray(img)
         if img.ndim == 2:
-            # Grayscale
-            h, w = img.shape
-            qimg = QImage(
-                img.tobytes(),
-                w,
-                h,
-                w,
-                QImage.Format.Format_Grayscale8
-            )
+            # Grayscale (16 bits, p. ej. térmicas o de profundidad, también sin convertir)
+            if img.dtype == np.uint16:
+                fmt = QImage.Format.Format_Grayscale16
+            else:
+                fmt = QImage.Format.Format_Grayscale8
         elif img.ndim == 3:
-            h, w, ch = img.shape
+            ch = img.shape[2]
             if ch == 3:
-                # BGR → RGB
-                img = img[:, :, ::-1]
-                fmt = QImage.Format.Format_RGB888
-                bytes_per_line = 3 * w
+                # BGR nativo de OpenCV
+                fmt = QImage.Format.Format_BGR888
             elif ch == 4:
-                # BGRA → RGBA
-                img = img[:, :, [2, 1, 0, 3]]
-                fmt = QImage.Format.Format_RGBA8888
-                bytes_per_line = 4 * w
+                # BGRA: en memoria coincide con ARGB32 (little-endian)
+                fmt = QImage.Format.Format_ARGB32
             else:
                 raise ValueError("Formato de imagen no soportado")
-
-            qimg = QImage(
-                img.tobytes(),
-                w,
-                h,
-                bytes_per_line,
-                fmt
-            )
         else:
             raise ValueError("Dimensiones de imagen no soportadas")
 
-        return QPixmap.fromImage(qimg)
+        h, w = img.shape[:2]
+        return img, QImage(img.data, w, h, img.strides[0], fmt)
 
     def clear_image(self):
         """Limpia la imagen y muestra el placeholder"""
+        self._frame_image = None
+        self._frame_buffer = None
         self.original_pixmap = self.placeholder_pixmap
+        self._has_user_content = False
         self._update_display()
+        self.update()
 
     def has_content(self):
         """Retorna True si hay contenido diferente al placeholder"""
-        return (self.original_pixmap is not None and 
-                self.original_pixmap != self.placeholder_pixmap)
\ No newline at end of file
+        return self._has_user_content